@@ -0,0 +1,121 @@
+"""
+Admission control for /chat
+Caps in-flight requests per process and sheds load when the request queue backlog
+cannot be served before the response deadline
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Request refused; carries the HTTP status and Retry-After hint"""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+
+class AdmissionController:
+    """In-flight cap plus queue-depth based wait estimate
+
+    The worker's reported processing time feeds an EWMA of service time; with
+    the sampled queue depth and consumer count that gives the expected wait for
+    a newly published request.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        deadline_seconds: float,
+        sample_interval: float = 2.0,
+        consumer_concurrency: int = 1,
+        initial_service_time: float = 5.0,
+        ewma_alpha: float = 0.2,
+    ):
+        self.max_in_flight = max_in_flight
+        self.deadline_seconds = deadline_seconds
+        self.sample_interval = sample_interval
+        self.consumer_concurrency = consumer_concurrency
+        self.ewma_alpha = ewma_alpha
+        self.service_time = initial_service_time
+        self.in_flight = 0
+        self.queue_depth: Optional[int] = None
+        self.consumer_count: Optional[int] = None
+        self.sampled_at: Optional[float] = None
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"in_flight": 0, "backlog": 0}
+
+    def record_service_time(self, seconds: float) -> None:
+        """Feed a worker processing time into the EWMA"""
+        if seconds and seconds > 0:
+            self.service_time += self.ewma_alpha * (seconds - self.service_time)
+
+    def _sample_fresh(self) -> bool:
+        # Fail open when the sampler is stale (e.g. broker unreachable)
+        return self.sampled_at is not None and time.monotonic() - self.sampled_at < 3 * self.sample_interval
+
+    def expected_wait(self) -> Optional[float]:
+        """Estimated seconds until a new request is answered, or None if unknown"""
+        if not self._sample_fresh():
+            return None
+        if not self.consumer_count:
+            # Nobody is draining the queue; a backlog will not be served at all
+            return math.inf if self.queue_depth else self.service_time
+        parallelism = self.consumer_count * self.consumer_concurrency
+        return (self.queue_depth // parallelism + 1) * self.service_time
+
+    def acquire(self) -> None:
+        """Take an in-flight slot or raise AdmissionRejected"""
+        if self.in_flight >= self.max_in_flight:
+            self.rejected["in_flight"] += 1
+            raise AdmissionRejected(
+                429, max(1, math.ceil(self.service_time)), "Too many requests in flight - please retry"
+            )
+
+        wait = self.expected_wait()
+        if wait is not None and wait > self.deadline_seconds:
+            self.rejected["backlog"] += 1
+            retry_after = self.deadline_seconds if math.isinf(wait) else wait - self.deadline_seconds
+            raise AdmissionRejected(
+                503, max(1, math.ceil(retry_after)), "Chat backlog too deep to answer in time - please retry"
+            )
+
+        self.in_flight += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+
+    async def run_sampler(self, sample: Callable[[], Awaitable[Tuple[int, int]]]) -> None:
+        """Periodically refresh (queue depth, consumer count)"""
+        while True:
+            try:
+                self.queue_depth, self.consumer_count = await sample()
+                self.sampled_at = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Queue depth sample failed: {e}")
+            await asyncio.sleep(self.sample_interval)
+
+    def stats(self) -> dict:
+        wait = self.expected_wait()
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "deadline_seconds": self.deadline_seconds,
+            "queue_depth": self.queue_depth,
+            "consumer_count": self.consumer_count,
+            "sample_age_seconds": None if self.sampled_at is None else round(time.monotonic() - self.sampled_at, 2),
+            "service_time_seconds": round(self.service_time, 3),
+            "expected_wait_seconds": None if wait is None or math.isinf(wait) else round(wait, 2),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
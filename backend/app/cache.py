@@ -0,0 +1,179 @@
+"""
+Versioned read-through cache
+Reads of the session list and message pages are cached in-process per key, each
+tagged with the key's version when it was filled:
+- Writes bump the version, so older entries are simply never served again
+- An invalidation backend feeds bumps from other replicas (and the worker)
+- While the backend cannot guarantee it sees every change, the cache is bypassed
+"""
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+
+class VersionedCache:
+    """Bounded LRU of (key, params) -> value, valid only while key's version is unchanged
+    (used from one event loop)
+
+    Version counters are themselves bounded; forgetting one raises the floor every
+    unknown key reports, which conservatively invalidates entries filled before.
+    """
+
+    def __init__(self, max_rows: int = 20000, ttl_seconds: float = 300.0, max_versions: int = 100000):
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.max_versions = max_versions
+        self._clock = itertools.count(1)
+        self._floor = 0
+        self._versions: "OrderedDict[Hashable, int]" = OrderedDict()
+        # (key, params) -> (version, expires_at, rows, value)
+        self._entries: "OrderedDict[Tuple[Hashable, Hashable], Tuple[int, float, int, Any]]" = OrderedDict()
+        self._rows = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.bumps = 0
+
+    def version(self, key: Hashable) -> int:
+        return self._versions.get(key, self._floor)
+
+    def bump(self, key: Optional[Hashable] = None) -> None:
+        """Invalidate key, or every key if None"""
+        self.bumps += 1
+        if key is None:
+            self._floor = next(self._clock)
+            self._versions.clear()
+            self._entries.clear()
+            self._rows = 0
+            return
+        self._versions[key] = next(self._clock)
+        self._versions.move_to_end(key)
+        while len(self._versions) > self.max_versions:
+            self._versions.popitem(last=False)
+            self._floor = next(self._clock)
+
+    def get(self, key: Hashable, params: Hashable) -> Optional[Any]:
+        entry = self._entries.get((key, params))
+        if entry is None:
+            self.misses += 1
+            return None
+        version, expires_at, _, value = entry
+        if version != self.version(key) or expires_at < time.monotonic():
+            self.stale += 1
+            self.misses += 1
+            self._remove((key, params))
+            return None
+        self.hits += 1
+        self._entries.move_to_end((key, params))
+        return value
+
+    def put(self, key: Hashable, params: Hashable, version: int, value: Any, rows: int = 1) -> None:
+        """Store value read at version; dropped if the key changed while it was being read"""
+        if version != self.version(key) or rows > self.max_rows:
+            return
+        self._remove((key, params))
+        self._entries[(key, params)] = (version, time.monotonic() + self.ttl_seconds, rows, value)
+        self._rows += rows
+        while self._rows > self.max_rows:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_key: Tuple[Hashable, Hashable]) -> None:
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._rows -= entry[2]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "rows": self._rows,
+            "max_rows": self.max_rows,
+            "versions": len(self._versions),
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "bumps": self.bumps,
+        }
+
+
+class LocalInvalidation:
+    """Single replica: only this process writes, so local bumps are enough"""
+
+    name = "local"
+    coherent = True
+
+    async def start(self, on_change: Callable[[Optional[str]], None]) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "coherent": self.coherent}
+
+
+class PostgresInvalidation:
+    """LISTENs on the channel a trigger on sessions notifies with the changed session id
+
+    Sees every writer (other replicas, the worker's title updates). After a disconnect
+    everything is invalidated, since notifications sent meanwhile are lost.
+    """
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, channel: str = "session_changes", reconnect_seconds: float = 5.0):
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_seconds = reconnect_seconds
+        self.coherent = False
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        self.notifications = 0
+        self.reconnects = 0
+
+    async def start(self, on_change: Callable[[Optional[str]], None]) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._listen(on_change))
+
+    async def _listen(self, on_change: Callable[[Optional[str]], None]) -> None:
+        while True:
+            try:
+                self._conn = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True, connect_timeout=5)
+                await self._conn.execute(f"LISTEN {self.channel}")
+                on_change(None)
+                self.coherent = True
+                logger.info(f"Listening for cache invalidations on '{self.channel}'")
+                async for notify in self._conn.notifies():
+                    self.notifications += 1
+                    on_change(notify.payload or None)
+            except psycopg.Error as e:
+                logger.warning(f"Cache invalidation listener lost, bypassing the read cache: {e}")
+            finally:
+                self.coherent = False
+                if self._conn is not None:
+                    await self._conn.close()
+            self.reconnects += 1
+            await asyncio.sleep(self.reconnect_seconds)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "coherent": self.coherent,
+            "notifications": self.notifications,
+            "reconnects": self.reconnects,
+        }
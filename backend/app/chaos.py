@@ -100,7 +100,7 @@ class TrafficGenerator:
                 # Send chat request to backend (same pod, localhost)
                 response = requests.post(
                     "http://localhost:8000/chat",
-                    json={"prompt": random.choice(prompts)},
+                    json={"prompt": random.choice(prompts), "priority": "background"},
                     timeout=45  # Increased timeout to prevent premature failures
                 )
                 
@@ -0,0 +1,190 @@
+"""
+Async Postgres access
+One psycopg AsyncConnectionPool shared by all endpoints:
+- Statements are prepared server-side on each connection once they are reused (prepare_threshold)
+- Default statement timeout set per connection; endpoints can override it (SET LOCAL)
+- Time spent waiting for a pooled connection is recorded per endpoint
+"""
+import base64
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timeouts(spec: str) -> Dict[str, int]:
+    """'list_sessions=2000,session_messages=5000' -> {endpoint: milliseconds}"""
+    timeouts: Dict[str, int] = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        endpoint, _, value = item.partition("=")
+        timeouts[endpoint.strip()] = int(value)
+    return timeouts
+
+
+def encode_cursor(position: Tuple[datetime, Any]) -> str:
+    """Opaque keyset cursor for a (timestamp, id) position"""
+    timestamp, row_id = position
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, _, row_id = raw.partition("|")
+        position = datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if position[0].tzinfo is None:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return position
+
+
+def encode_ranked_cursor(position: Tuple[float, datetime, Any]) -> str:
+    """Opaque keyset cursor for a (rank, timestamp, id) position"""
+    rank, timestamp, row_id = position
+    return base64.urlsafe_b64encode(f"{rank!r}|{timestamp.isoformat()}|{row_id}".encode()).decode().rstrip("=")
+
+
+def decode_ranked_cursor(cursor: str) -> Tuple[float, datetime, uuid.UUID]:
+    """Inverse of encode_ranked_cursor; raises ValueError for anything it did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, timestamp, row_id = raw.split("|")
+        position = float(rank), datetime.fromisoformat(timestamp), uuid.UUID(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not math.isfinite(position[0]) or position[1].tzinfo is None:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return position
+
+
+class EndpointStats:
+    """Pool wait samples and failures for one endpoint"""
+
+    def __init__(self, window: int):
+        self.waits: Deque[float] = deque(maxlen=window)
+        self.acquired = 0
+        self.pool_timeouts = 0
+        self.statement_timeouts = 0
+        self.wait_seconds_max = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        ordered = sorted(self.waits)
+        return {
+            "acquired": self.acquired,
+            "wait_ms_avg": round(1000 * sum(ordered) / len(ordered), 2) if ordered else 0.0,
+            "wait_ms_p99": round(1000 * ordered[max(0, math.ceil(0.99 * len(ordered)) - 1)], 2) if ordered else 0.0,
+            "wait_ms_max": round(1000 * self.wait_seconds_max, 2),
+            "pool_timeouts": self.pool_timeouts,
+            "statement_timeouts": self.statement_timeouts,
+        }
+
+
+class Database:
+    """Async connection pool with per-endpoint statement timeouts and wait metrics"""
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 10.0,
+        statement_timeout_ms: int = 5000,
+        endpoint_timeouts_ms: Optional[Dict[str, int]] = None,
+        prepare_threshold: Optional[int] = 0,
+        stats_window: int = 1000,
+    ):
+        self.dsn = dsn
+        self.statement_timeout_ms = statement_timeout_ms
+        self.endpoint_timeouts_ms = endpoint_timeouts_ms or {}
+        self.stats_window = stats_window
+        self.pool = AsyncConnectionPool(
+            conninfo=dsn,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            kwargs={
+                # 0 prepares every statement on first use; None disables (e.g. behind pgbouncer)
+                "prepare_threshold": prepare_threshold,
+                "autocommit": True,
+                "options": f"-c statement_timeout={statement_timeout_ms}",
+            },
+            open=False,
+        )
+        self._endpoints: Dict[str, EndpointStats] = {}
+
+    async def open(self) -> None:
+        await self.pool.open(wait=True)
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    def _endpoint(self, endpoint: str) -> EndpointStats:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = EndpointStats(self.stats_window)
+        return stats
+
+    @asynccontextmanager
+    async def connection(
+        self, endpoint: str = "default", transaction: bool = True
+    ) -> AsyncIterator[psycopg.AsyncConnection]:
+        """Pooled connection inside a transaction committed on clean exit
+
+        Connections are in autocommit mode, so a single statement run with
+        transaction=False costs one round trip. Raises PoolTimeout when no connection
+        frees up in time and QueryCanceled when a statement exceeds the endpoint's timeout.
+        """
+        stats = self._endpoint(endpoint)
+        timeout_ms = self.endpoint_timeouts_ms.get(endpoint)
+        override = timeout_ms is not None and timeout_ms != self.statement_timeout_ms
+        start = time.perf_counter()
+        try:
+            async with self.pool.connection() as conn:
+                waited = time.perf_counter() - start
+                stats.acquired += 1
+                stats.waits.append(waited)
+                stats.wait_seconds_max = max(stats.wait_seconds_max, waited)
+                if not transaction and not override:
+                    yield conn
+                    return
+                # SET LOCAL ends with the transaction, so pooled connections keep the default
+                async with conn.transaction():
+                    if override:
+                        await conn.execute("SELECT set_config('statement_timeout', %s, true)", (str(timeout_ms),))
+                    yield conn
+        except PoolTimeout:
+            stats.pool_timeouts += 1
+            logger.warning(f"No database connection available for {endpoint} within {self.pool.timeout}s")
+            raise
+        except psycopg.errors.QueryCanceled:
+            stats.statement_timeouts += 1
+            logger.warning(f"Statement timeout in {endpoint}")
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.pool.get_stats()
+        return {
+            "pool": {
+                "min_size": self.pool.min_size,
+                "max_size": self.pool.max_size,
+                "size": pool.get("pool_size", 0),
+                "available": pool.get("pool_available", 0),
+                "waiting": pool.get("requests_waiting", 0),
+            },
+            "statement_timeout_ms": self.statement_timeout_ms,
+            "endpoint_timeouts_ms": dict(self.endpoint_timeouts_ms),
+            "endpoints": {name: stats.stats() for name, stats in self._endpoints.items()},
+        }
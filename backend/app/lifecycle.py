@@ -0,0 +1,388 @@
+"""
+Message data lifecycle
+chat_messages is range-partitioned by created_at, one partition per calendar month (UTC):
+- Partitions are created ahead of time, so inserts never wait on DDL
+- With a retention period, partitions past it are detached without blocking inserts,
+  then dropped or moved to an archive schema (never a bulk DELETE)
+- Deleted sessions are hidden right away and their messages removed in small batches
+Each job runs on one replica at a time (advisory lock) over its own connection.
+"""
+import asyncio
+import logging
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import psycopg
+from psycopg import sql
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r"^chat_messages_p(\d{4})(\d{2})$")
+
+ATTACHED_PARTITIONS_SQL = """
+SELECT c.relname, i.inhdetachpending
+FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'chat_messages'::regclass
+"""
+
+# Partitions detached by an earlier run that did not get to retire them
+DETACHED_PARTITIONS_SQL = """
+SELECT c.relname FROM pg_class c
+WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind = 'r'
+  AND c.relname ~ '^chat_messages_p[0-9]{6}$'
+  AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+"""
+
+# Same bookkeeping as the delete trigger, which dropping a partition does not fire
+UNCOUNT_PARTITION_SQL = """
+UPDATE sessions s
+SET message_count = GREATEST(s.message_count - d.removed, 0),
+    last_message_at = CASE WHEN d.last_at < s.last_message_at THEN s.last_message_at
+        ELSE (SELECT MAX(created_at) FROM chat_messages m WHERE m.session_id = s.id) END
+FROM (
+    SELECT session_id, COUNT(*) AS removed, MAX(created_at) AS last_at
+    FROM {table} GROUP BY session_id
+) d
+WHERE s.id = d.session_id
+RETURNING d.removed
+"""
+
+PENDING_DELETES_SQL = """
+SELECT id FROM sessions WHERE deleted_at IS NOT NULL ORDER BY deleted_at LIMIT %s
+"""
+
+# Row-value IN keeps each batch to one index range scan per partition
+DELETE_MESSAGES_BATCH_SQL = """
+DELETE FROM chat_messages WHERE (session_id, created_at, id) IN (
+    SELECT session_id, created_at, id FROM chat_messages WHERE session_id = %s LIMIT %s
+)
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    years, index = divmod(month.month - 1 + months, 12)
+    return date(month.year + years, index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"chat_messages_p{month:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+
+def _month_start(month: date) -> datetime:
+    return datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+
+
+async def create_partition(conn: psycopg.AsyncConnection, month: date, lock_timeout_ms: Optional[int] = None) -> None:
+    """Add the partition for one month
+
+    Created standalone and then attached: ATTACH only takes a SHARE UPDATE EXCLUSIVE
+    lock on chat_messages, where CREATE TABLE ... PARTITION OF would block inserts.
+    """
+    name = sql.Identifier(partition_name(month))
+    async with conn.transaction():
+        if lock_timeout_ms is not None:
+            await conn.execute("SELECT set_config('lock_timeout', %s, true)", (str(lock_timeout_ms),))
+        await conn.execute(sql.SQL("CREATE TABLE {} (LIKE chat_messages INCLUDING DEFAULTS INCLUDING GENERATED)").format(name))
+        await conn.execute(
+            sql.SQL("ALTER TABLE chat_messages ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+                name, sql.Literal(_month_start(month)), sql.Literal(_month_start(add_months(month, 1)))
+            )
+        )
+
+
+async def _connect(dsn: str) -> psycopg.AsyncConnection:
+    # No statement timeout: detaching waits for queries still reading the partition
+    return await psycopg.AsyncConnection.connect(
+        dsn, autocommit=True, connect_timeout=5, options="-c statement_timeout=0"
+    )
+
+
+async def _try_lock(conn: psycopg.AsyncConnection, name: str) -> bool:
+    cur = await conn.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (name,))
+    return (await cur.fetchone())[0]
+
+
+async def _unlock(conn: psycopg.AsyncConnection, name: str) -> None:
+    await conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+
+
+class MessageRetention:
+    """Keeps partitions created ahead and retires those past the retention period
+
+    retention_days=0 keeps every partition. action is "drop" or "archive"; archived
+    partitions keep their data in archive_schema, outside chat_messages and without
+    the foreign key to sessions.
+    """
+
+    LOCK = "chat_messages_retention"
+
+    def __init__(
+        self,
+        dsn: str,
+        retention_days: int = 0,
+        action: str = "archive",
+        archive_schema: str = "chat_archive",
+        premake_months: int = 3,
+        interval_seconds: float = 3600.0,
+        lock_timeout_ms: int = 5000,
+    ):
+        if action not in ("drop", "archive"):
+            raise ValueError(f"Unknown retention action: {action!r}")
+        self.dsn = dsn
+        self.retention_days = retention_days
+        self.action = action
+        self.archive_schema = archive_schema
+        self.premake_months = premake_months
+        self.interval_seconds = interval_seconds
+        self.lock_timeout_ms = lock_timeout_ms
+        self._task: Optional[asyncio.Task] = None
+        self.partitions = 0
+        self.created = 0
+        self.retired = 0
+        self.rows_retired = 0
+        self.runs = 0
+        self.skipped_runs = 0
+        self.failures = 0
+        self.last_run_at: Optional[float] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                # Anything but cancellation; an escaped error would end the job for good
+                self.failures += 1
+                logger.warning(
+                    f"Message retention run failed, retrying in {self.interval_seconds:.0f}s: {e!r}", exc_info=True
+                )
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self) -> None:
+        async with await _connect(self.dsn) as conn:
+            if not await _try_lock(conn, self.LOCK):
+                # Another replica is on it
+                self.skipped_runs += 1
+                return
+            try:
+                cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+                await self._retire_expired(conn, cutoff)
+                await self._premake(conn)
+            finally:
+                await _unlock(conn, self.LOCK)
+        self.runs += 1
+        self.last_run_at = time.time()
+
+    async def _premake(self, conn: psycopg.AsyncConnection) -> None:
+        cur = await conn.execute(ATTACHED_PARTITIONS_SQL)
+        attached = {row[0] for row in await cur.fetchall()}
+        current = datetime.now(timezone.utc).date().replace(day=1)
+        for offset in range(self.premake_months + 1):
+            month = add_months(current, offset)
+            if partition_name(month) in attached:
+                continue
+            try:
+                await create_partition(conn, month, self.lock_timeout_ms)
+            except psycopg.errors.LockNotAvailable:
+                # Busy right now; the next run still has the months ahead as slack
+                logger.warning(f"Timed out locking chat_messages to add {partition_name(month)}, will retry")
+                break
+            attached.add(partition_name(month))
+            self.created += 1
+            logger.info(f"Created message partition {partition_name(month)}")
+        self.partitions = len(attached)
+
+    async def _retire_expired(self, conn: psycopg.AsyncConnection, cutoff: datetime) -> None:
+        if self.retention_days <= 0:
+            return
+
+        def expired(name: str) -> bool:
+            month = partition_month(name)
+            return month is not None and _month_start(add_months(month, 1)) <= cutoff
+
+        cur = await conn.execute(ATTACHED_PARTITIONS_SQL)
+        for name, detach_pending in await cur.fetchall():
+            if detach_pending:
+                # An earlier DETACH ... CONCURRENTLY was interrupted
+                await conn.execute(
+                    sql.SQL("ALTER TABLE chat_messages DETACH PARTITION {} FINALIZE").format(sql.Identifier(name))
+                )
+            elif expired(name):
+                # Waits for queries that still see the partition, but never blocks inserts
+                await conn.execute(
+                    sql.SQL("ALTER TABLE chat_messages DETACH PARTITION {} CONCURRENTLY").format(sql.Identifier(name))
+                )
+
+        cur = await conn.execute(DETACHED_PARTITIONS_SQL)
+        for (name,) in await cur.fetchall():
+            if expired(name):
+                await self._retire(conn, name)
+
+    async def _retire(self, conn: psycopg.AsyncConnection, name: str) -> None:
+        """Uncount a detached partition's messages, then drop or archive it, atomically"""
+        table = sql.Identifier(name)
+        async with conn.transaction():
+            cur = await conn.execute(sql.SQL(UNCOUNT_PARTITION_SQL).format(table=table))
+            rows = sum(row[0] for row in await cur.fetchall())
+            if self.action == "drop":
+                await conn.execute(sql.SQL("DROP TABLE {}").format(table))
+            else:
+                # Session deletes must not cascade into the archive
+                cur = await conn.execute(
+                    "SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", (name,)
+                )
+                for (constraint,) in await cur.fetchall():
+                    await conn.execute(
+                        sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(table, sql.Identifier(constraint))
+                    )
+                await conn.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(sql.Identifier(self.archive_schema)))
+                await conn.execute(
+                    sql.SQL("ALTER TABLE {} SET SCHEMA {}").format(table, sql.Identifier(self.archive_schema))
+                )
+        self.retired += 1
+        self.rows_retired += rows
+        logger.info(f"Retired message partition {name} ({rows} rows, {self.action})")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retention_days": self.retention_days,
+            "action": self.action,
+            "partitions": self.partitions,
+            "created": self.created,
+            "retired": self.retired,
+            "rows_retired": self.rows_retired,
+            "runs": self.runs,
+            "skipped_runs": self.skipped_runs,
+            "failures": self.failures,
+            "last_run_at": self.last_run_at,
+        }
+
+
+class SessionDeleter:
+    """Removes the messages of sessions marked deleted in small batches, then the sessions
+
+    Each batch is its own short transaction, so locks and dead tuples stay bounded
+    however long the session was. wake() starts a pass right away; otherwise pending
+    deletes (e.g. from other replicas) are picked up every poll_seconds.
+    """
+
+    LOCK = "session_deletes"
+
+    def __init__(
+        self,
+        dsn: str,
+        batch_rows: int = 1000,
+        pause_seconds: float = 0.01,
+        poll_seconds: float = 30.0,
+        sessions_per_pass: int = 100,
+    ):
+        self.dsn = dsn
+        self.batch_rows = batch_rows
+        self.pause_seconds = pause_seconds
+        self.poll_seconds = poll_seconds
+        self.sessions_per_pass = sessions_per_pass
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        self.sessions_deleted = 0
+        self.rows_deleted = 0
+        self.batches = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        # Finish deletes left over from before a restart
+        self._wake.set()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.purge()
+            except Exception as e:
+                # Anything but cancellation; an escaped error would end the job for good
+                self.failures += 1
+                logger.warning(f"Session delete pass failed: {e!r}", exc_info=True)
+                if self._conn is not None:
+                    await self._conn.close()
+
+    async def _connection(self) -> psycopg.AsyncConnection:
+        if self._conn is None or self._conn.closed or self._conn.broken:
+            self._conn = await _connect(self.dsn)
+        return self._conn
+
+    async def purge(self) -> int:
+        """Delete every session marked deleted; returns how many were removed"""
+        conn = await self._connection()
+        if not await _try_lock(conn, self.LOCK):
+            return 0
+        deleted = 0
+        try:
+            while True:
+                cur = await conn.execute(PENDING_DELETES_SQL, (self.sessions_per_pass,))
+                session_ids: List[Any] = [row[0] for row in await cur.fetchall()]
+                if not session_ids:
+                    return deleted
+                for session_id in session_ids:
+                    await self._purge_session(conn, session_id)
+                    deleted += 1
+        finally:
+            await _unlock(conn, self.LOCK)
+
+    async def _purge_session(self, conn: psycopg.AsyncConnection, session_id: Any) -> None:
+        start = time.monotonic()
+        rows = 0
+        while True:
+            cur = await conn.execute(DELETE_MESSAGES_BATCH_SQL, (session_id, self.batch_rows))
+            self.batches += 1
+            rows += cur.rowcount
+            if cur.rowcount < self.batch_rows:
+                break
+            await asyncio.sleep(self.pause_seconds)
+        # Nothing left to cascade to, unless a message raced in after the last batch
+        await conn.execute("DELETE FROM sessions WHERE id = %s AND deleted_at IS NOT NULL", (session_id,))
+        self.rows_deleted += rows
+        self.sessions_deleted += 1
+        logger.info(f"Deleted session {session_id} ({rows} messages) in {time.monotonic() - start:.2f}s")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._conn is not None:
+            await self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions_deleted": self.sessions_deleted,
+            "rows_deleted": self.rows_deleted,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
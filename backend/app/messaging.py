@@ -1,100 +1,208 @@
 """
-RabbitMQ messaging using Kombu for DSM support
+RabbitMQ messaging for the backend request path
+AsyncRabbitMQClient is a native asyncio (aio-pika) client; bodies use kombu's
+serializers so they stay readable by the worker's Kombu consumers
 """
-import json
 import logging
-import os
-import threading
-from typing import Dict, Callable, Optional
-from kombu import Connection, Producer, Consumer, Queue, Exchange
+from typing import Awaitable, Dict, Callable, Optional, Set, Tuple
+from kombu.compression import compress, decompress
+from kombu.serialization import dumps, loads, prepare_accept_content
+from kombu.utils.encoding import ensure_bytes
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage, AbstractRobustConnection
+from aio_pika.pool import Pool
+from ddtrace import tracer
+
+# DSM checkpoints must be set manually for aio-pika (no auto-instrumentation)
+try:
+    from ddtrace.data_streams import set_consume_checkpoint, set_produce_checkpoint
+except ImportError:  # pragma: no cover - older ddtrace
+    set_consume_checkpoint = None
+    set_produce_checkpoint = None
 
 logger = logging.getLogger(__name__)
 
-class RabbitMQClient:
-    """Kombu-based RabbitMQ client with DSM support"""
-    
-    def __init__(self, host: str, port: int, user: str, password: str):
-        self.broker_url = f'amqp://{user}:{password}@{host}:{port}//'
-        self.connection: Optional[Connection] = None
-        self.producer: Optional[Producer] = None
-        
-    def connect(self):
-        """Establish connection and create producer"""
-        self.connection = Connection(self.broker_url)
-        self.connection.connect()
-        self.producer = Producer(self.connection)
-        logger.info(f"Connected to RabbitMQ via Kombu at {self.broker_url}")
-        
-    def publish(self, queue_name: str, message: dict):
-        """Publish message to queue (DSM auto-instrumented)"""
-        if not self.producer:
-            self.connect()
-            
-        # IMPORTANT: Pass dict directly, let Kombu serialize + inject DSM headers
-        self.producer.publish(
-            message,  # Dict, not json.dumps(message)
-            routing_key=queue_name,
-            declare=[Queue(queue_name, durable=True)],
-            serializer='json',  # Let Kombu handle JSON serialization
-        )
+# Every body carries a schema version. Consumers accept JSON and msgpack (optionally
+# compressed, see the "compression" header), so producers can switch format once
+# every consumer runs this code.
+MESSAGE_SCHEMA_VERSION = 2
+ACCEPT_CONTENT = ['json', 'msgpack']
+_ACCEPTED_CONTENT_TYPES = prepare_accept_content(ACCEPT_CONTENT)
+
+
+def encode_message(
+    message: dict,
+    serializer: str = 'json',
+    compression: Optional[str] = None,
+    compression_min_bytes: int = 1024,
+) -> Tuple[bytes, str, str, Dict[str, str]]:
+    """Serialize (and maybe compress) a message; returns (body, content_type, content_encoding, headers)
+
+    The body is compressed only when it reaches compression_min_bytes; headers then
+    carries the compression type in kombu's format so kombu consumers decode it too.
+    """
+    content_type, content_encoding, body = dumps(
+        dict(message, schema_version=MESSAGE_SCHEMA_VERSION), serializer=serializer
+    )
+    body = ensure_bytes(body)
+    headers: Dict[str, str] = {}
+    if compression and len(body) >= compression_min_bytes:
+        body, headers['compression'] = compress(body, compression)
+    return body, content_type, content_encoding, headers
+
+
+def decode_message(body: bytes, content_type: str, content_encoding: str, headers: Optional[dict] = None) -> dict:
+    """Inverse of encode_message; raises on unknown or untrusted content types"""
+    compression_type = (headers or {}).get('compression')
+    if compression_type:
+        body = decompress(body, compression_type)
+    return loads(body, content_type, content_encoding, accept=_ACCEPTED_CONTENT_TYPES)
+
+
+class AsyncRabbitMQClient:
+    """aio-pika based RabbitMQ client with DSM header propagation
+
+    - Robust connection: reconnects automatically and re-registers consumers
+    - Pool of publisher channels with publisher confirms
+    - Queue declarations cached per connection
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        channel_pool_size: int = 4,
+        heartbeat: int = 30,
+        serializer: str = 'json',
+        compression: Optional[str] = None,
+        compression_min_bytes: int = 1024,
+    ):
+        self.broker_url = f'amqp://{user}:{password}@{host}:{port}/?heartbeat={heartbeat}'
+        self.channel_pool_size = channel_pool_size
+        self.serializer = serializer
+        self.compression = compression
+        self.compression_min_bytes = compression_min_bytes
+        self.connection: Optional[AbstractRobustConnection] = None
+        self.channel_pool: Optional[Pool] = None
+        self._declared: Set[str] = set()
+
+    async def connect(self):
+        """Open the robust connection and the publisher channel pool"""
+        self.connection = await aio_pika.connect_robust(self.broker_url)
+        self.connection.reconnect_callbacks.add(self._on_reconnect)
+        self.channel_pool = Pool(self._open_channel, max_size=self.channel_pool_size)
+        logger.info(f"Connected to RabbitMQ via aio-pika (channel pool size {self.channel_pool_size})")
+
+    async def _open_channel(self) -> AbstractChannel:
+        return await self.connection.channel(publisher_confirms=True)
+
+    def _on_reconnect(self, *args, **kwargs):
+        # Broker may have lost non-durable state; declare again on next use
+        self._declared.clear()
+        logger.warning("RabbitMQ connection re-established")
+
+    async def _declare(self, channel: AbstractChannel, queue_name: str):
+        if queue_name not in self._declared:
+            await channel.declare_queue(queue_name, durable=True)
+            self._declared.add(queue_name)
+
+    async def publish(self, queue_name: str, message: dict, reply_to: Optional[str] = None):
+        """Publish a message in the configured format and wait for the broker confirm"""
+        if not self.connection:
+            await self.connect()
+
+        with tracer.trace("rabbitmq.publish", service="rabbitmq", resource=queue_name, span_type="queue") as span:
+            span.set_tag("rabbitmq.routing_key", queue_name)
+            body, content_type, content_encoding, headers = encode_message(
+                message, self.serializer, self.compression, self.compression_min_bytes
+            )
+            span.set_metric("rabbitmq.message_size", len(body))
+            if set_produce_checkpoint is not None:
+                set_produce_checkpoint("rabbitmq", queue_name, headers.__setitem__)
+
+            async with self.channel_pool.acquire() as channel:
+                await self._declare(channel, queue_name)
+                await channel.default_exchange.publish(
+                    aio_pika.Message(
+                        body=body,
+                        content_type=content_type,
+                        content_encoding=content_encoding,
+                        delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+                        headers=headers,
+                        reply_to=reply_to,
+                        correlation_id=message.get("request_id"),
+                    ),
+                    routing_key=queue_name,
+                )
         logger.info(f"Published message to queue '{queue_name}': {message.get('request_id', 'unknown')}")
-        
-    def consume(self, queue_name: str, callback: Callable[[dict], None], timeout: float = None):
-        """Consume messages from queue (DSM auto-instrumented)"""
+
+    async def queue_stats(self, queue_name: str) -> Tuple[int, int]:
+        """(message_count, consumer_count) via a passive declare on a throwaway channel"""
+        if not self.connection:
+            await self.connect()
+
+        # A failed passive declare closes its channel, so keep it out of the pool
+        channel = await self.connection.channel()
+        try:
+            queue = await channel.declare_queue(queue_name, passive=True)
+            result = queue.declaration_result
+            return result.message_count, result.consumer_count
+        finally:
+            if not channel.is_closed:
+                await channel.close()
+
+    async def consume(
+        self,
+        queue_name: str,
+        callback: Callable[[dict], Awaitable[None]],
+        prefetch_count: int = 50,
+        exclusive: bool = False,
+    ):
+        """Register a consumer; it is restored automatically after reconnects
+
+        exclusive=True declares a private, auto-deleted queue owned by this connection.
+        """
         if not self.connection:
-            self.connect()
-            
-        def on_message(body, message):
-            """Process message and acknowledge (body is already deserialized by Kombu)"""
-            try:
-                # Kombu with accept=['json'] already deserializes JSON -> body is a dict
-                callback(body)
-                message.ack()
-            except Exception as e:
-                logger.error(f"Error processing message: {e}", exc_info=True)
-                message.reject()
-                
-        queue = Queue(queue_name, durable=True)
-        
-        with Consumer(
-            self.connection,
-            queues=[queue],
-            callbacks=[on_message],
-            accept=['json']
-        ):
-            logger.info(f"Started consuming from queue '{queue_name}'...")
-            
-            if timeout:
-                # Consume with timeout
-                self.connection.drain_events(timeout=timeout)
-            else:
-                # Consume indefinitely
-                while True:
-                    try:
-                        self.connection.drain_events(timeout=1)
-                    except TimeoutError:
-                        # Timeout is expected when no messages - continue waiting
-                        continue
-                    except Exception as e:
-                        logger.error(f"Error in consumer: {e}", exc_info=True)
-                        raise
-                            
-    def start_consumer_thread(self, queue_name: str, callback: Callable[[dict], None]):
-        """Start background consumer thread"""
-        def consumer_loop():
-            try:
-                self.consume(queue_name, callback)
-            except Exception as e:
-                logger.error(f"Consumer thread crashed: {e}", exc_info=True)
-                
-        thread = threading.Thread(target=consumer_loop, daemon=True)
-        thread.start()
-        logger.info(f"Background consumer thread started for queue '{queue_name}'")
-        return thread
-        
-    def close(self):
-        """Close connection"""
+            await self.connect()
+
+        channel = await self.connection.channel()
+        await channel.set_qos(prefetch_count=prefetch_count)
+        if exclusive:
+            queue = await channel.declare_queue(queue_name, exclusive=True, auto_delete=True)
+        else:
+            queue = await channel.declare_queue(queue_name, durable=True)
+
+        async def on_message(message: AbstractIncomingMessage):
+            async with message.process(requeue=False):
+                if set_consume_checkpoint is not None:
+                    headers = message.headers or {}
+                    set_consume_checkpoint("rabbitmq", queue_name, headers.get)
+                try:
+                    body = decode_message(
+                        message.body,
+                        message.content_type or 'application/json',
+                        message.content_encoding or 'utf-8',
+                        message.headers,
+                    )
+                except Exception as e:
+                    logger.error(f"Dropping undecodable message on '{queue_name}': {e}")
+                    return
+                try:
+                    await callback(body)
+                except Exception as e:
+                    logger.error(f"Error processing message: {e}", exc_info=True)
+                    raise
+
+        await queue.consume(on_message)
+        logger.info(f"Started consuming from queue '{queue_name}'...")
+
+    async def close(self):
+        """Close channel pool and connection"""
+        if self.channel_pool:
+            await self.channel_pool.close()
         if self.connection:
-            self.connection.release()
+            await self.connection.close()
             logger.info("Closed RabbitMQ connection")
-
@@ -0,0 +1,204 @@
+"""
+Write-behind persistence
+Completed chat messages are buffered and written in micro-batches bounded by size
+and time, so one commit covers many messages. Reads call barrier() first to see
+their own session's writes.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingWrite:
+    key: str
+    record: Any
+    queued_at: float
+    future: asyncio.Future = field(repr=False)
+
+
+class WriteBehindPersister:
+    """Buffers records and hands them to flush(records) in batches (used from one event loop)
+
+    Records are grouped by key (the session id) for barrier(). Transient errors
+    retry the whole batch with backoff; a permanent error splits the batch into
+    single-record writes so one bad record cannot sink the others.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], Awaitable[None]],
+        max_batch_size: int = 100,
+        max_delay_seconds: float = 0.05,
+        max_pending: int = 5000,
+        max_retries: int = 3,
+        permanent_errors: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.flush = flush
+        self.max_batch_size = max_batch_size
+        self.max_delay_seconds = max_delay_seconds
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.permanent_errors = permanent_errors
+        self._pending: List[PendingWrite] = []
+        # Not yet committed (queued or in a running flush), per key
+        self._uncommitted: Dict[str, List[PendingWrite]] = {}
+        self._changed = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_now = False
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self.records = 0
+        self.batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def add(self, key: str, record: Any) -> asyncio.Future:
+        """Queue a record; returns a future resolved once it is committed
+
+        Waits only when max_pending records are already buffered (backpressure).
+        """
+        while len(self._pending) >= self.max_pending:
+            self._space.clear()
+            await self._space.wait()
+        write = PendingWrite(key, record, time.monotonic(), asyncio.get_running_loop().create_future())
+        self._pending.append(write)
+        self._uncommitted.setdefault(key, []).append(write)
+        self._changed.set()
+        return write.future
+
+    async def barrier(self, key: Optional[str] = None) -> None:
+        """Flush right away and wait until earlier writes for key (or all keys) are committed"""
+        if key is None:
+            writes = [w for ws in self._uncommitted.values() for w in ws]
+        else:
+            writes = list(self._uncommitted.get(key, ()))
+        if not writes:
+            return
+        self._flush_now = True
+        self._changed.set()
+        # Failed writes were already logged; readers just see what was committed
+        await asyncio.gather(*(w.future for w in writes), return_exceptions=True)
+
+    async def _next_batch(self) -> List[PendingWrite]:
+        while not self._pending:
+            if self._closing:
+                return []
+            self._changed.clear()
+            await self._changed.wait()
+        deadline = self._pending[0].queued_at + self.max_delay_seconds
+        while len(self._pending) < self.max_batch_size and not self._flush_now and not self._closing:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+        self._flush_now = False
+        batch = self._pending[:self.max_batch_size]
+        del self._pending[:self.max_batch_size]
+        if len(self._pending) < self.max_pending:
+            self._space.set()
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            if not batch:
+                return
+            try:
+                await self._write(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Write-behind flush crashed: {e}", exc_info=True)
+
+    async def _try_flush(self, writes: List[PendingWrite]) -> None:
+        start = time.perf_counter()
+        await self.flush([w.record for w in writes])
+        elapsed = time.perf_counter() - start
+        self.batches += 1
+        self.records += len(writes)
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    async def _write(self, batch: List[PendingWrite]) -> None:
+        error: Optional[Exception] = None
+        delay = 0.1
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._try_flush(batch)
+            except Exception as e:
+                error = e
+                if isinstance(e, self.permanent_errors) or attempt == self.max_retries:
+                    break
+                self.retries += 1
+                logger.warning(f"Write-behind flush of {len(batch)} failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay *= 2
+            else:
+                for write in batch:
+                    self._settle(write)
+                return
+
+        if isinstance(error, self.permanent_errors) and len(batch) > 1:
+            # Isolate the bad record(s) so the rest still get written
+            for write in batch:
+                await self._write([write])
+            return
+
+        self.dropped += len(batch)
+        logger.error(f"Dropping {len(batch)} write-behind records: {error}")
+        for write in batch:
+            self._settle(write, error)
+
+    def _settle(self, write: PendingWrite, error: Optional[BaseException] = None) -> None:
+        writes = self._uncommitted.get(write.key)
+        if writes is not None:
+            writes.remove(write)
+            if not writes:
+                del self._uncommitted[write.key]
+        if write.future.done():
+            return
+        if error is None:
+            write.future.set_result(None)
+        else:
+            write.future.set_exception(error)
+            # Mark retrieved; callers that don't wait for durability never look at it
+            write.future.exception()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Flush everything still buffered, then stop"""
+        self._closing = True
+        self._changed.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Write-behind close timed out with {len(self._pending)} records unflushed")
+                self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "uncommitted": sum(len(ws) for ws in self._uncommitted.values()),
+            "records": self.records,
+            "batches": self.batches,
+            "avg_batch_size": round(self.records / self.batches, 2) if self.batches else 0.0,
+            "flush_ms_avg": round(1000 * self.flush_seconds_total / self.batches, 2) if self.batches else 0.0,
+            "flush_ms_max": round(1000 * self.flush_seconds_max, 2),
+            "retries": self.retries,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,149 @@
+"""
+Correlation registry and late-reply bookkeeping for worker replies
+Maps request_id -> asyncio.Future so the response consumer can wake the waiting request directly
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+
+class ReplyRegistry:
+    """Tracks in-flight requests awaiting a worker reply"""
+
+    def __init__(self):
+        self._pending: Dict[str, Tuple[asyncio.AbstractEventLoop, Union[asyncio.Future, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, request_id: str) -> asyncio.Future:
+        """Create the future a request handler awaits (call from the event loop)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._pending[request_id] = (loop, future)
+        return future
+
+    def register_stream(self, request_id: str) -> asyncio.Queue:
+        """Create the queue a streaming handler reads chunk and final messages from"""
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._pending[request_id] = (loop, chunks)
+        return chunks
+
+    def resolve(self, request_id: str, data: dict) -> bool:
+        """Deliver a reply from any thread; returns False if nobody is waiting"""
+        with self._lock:
+            entry = self._pending.get(request_id)
+            if entry is None:
+                return False
+            loop, target = entry
+            is_stream = isinstance(target, asyncio.Queue)
+            if data.get("type") == "chunk":
+                if not is_stream:
+                    # Non-streaming waiters only care about the final reply
+                    return True
+            else:
+                # Entries stay registered until their final message
+                del self._pending[request_id]
+
+        if is_stream:
+            deliver = lambda: target.put_nowait(data)
+        else:
+            def deliver():
+                if not target.done():
+                    target.set_result(data)
+
+        try:
+            loop.call_soon_threadsafe(deliver)
+        except RuntimeError:
+            # Event loop already closed (shutdown in progress)
+            return False
+        return True
+
+    def discard(self, request_id: str) -> None:
+        """Forget a request (timeout or cancellation)"""
+        with self._lock:
+            self._pending.pop(request_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+class BoundedTTLStore:
+    """Thread-safe dict with a maximum size and per-entry expiry
+
+    Entries are kept in insertion order, which is also expiry order since
+    every entry shares the same TTL. When full, the oldest entry is evicted.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 300.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _purge_expired(self, now: float) -> None:
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+            self.expirations += 1
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            self._entries.pop(key, None)
+            while len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[key] = (now + self.ttl_seconds, value)
+
+    def add(self, key: str, value: Any) -> bool:
+        """Insert only if no live entry exists; returns whether it was inserted"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            if key in self._entries:
+                return False
+            while len(self._entries) >= self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._entries[key] = (now + self.ttl_seconds, value)
+            return True
+
+    def pop(self, key: str) -> Optional[Any]:
+        """Remove and return an entry, or None if absent or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._purge_expired(time.monotonic())
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
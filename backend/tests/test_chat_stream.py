@@ -0,0 +1,166 @@
+"""POST /chat and /chat/stream: chunk ordering, failures while saving the reply, and deleted sessions"""
+import asyncio
+import json
+
+import pytest
+from psycopg_pool import PoolTimeout
+
+from app import main
+
+SESSION_ID = "00000000-0000-0000-0000-0000000000aa"
+REQUEST_ID = "request-1"
+
+
+def chunk(seq, delta):
+    return {"request_id": REQUEST_ID, "type": "chunk", "seq": seq, "delta": delta}
+
+
+def final(response, seq):
+    return {"request_id": REQUEST_ID, "type": "final", "response": response, "seq": seq}
+
+
+def parse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    """Runs /chat/stream with the worker replaced by a scripted list of reply messages"""
+    saved = []
+
+    async def prepare_chat(req):
+        return SESSION_ID, dict(main.DUMMY_USER), REQUEST_ID
+
+    async def insert_message(message_id, session_id, prompt, reply, no_answer, user):
+        saved.append(reply)
+
+    monkeypatch.setattr(main, "_prepare_chat", prepare_chat)
+    monkeypatch.setattr(main, "insert_message", insert_message)
+    main.abandoned_requests.pop(REQUEST_ID)
+
+    def run(replies, after=None):
+        async def publish(req, session_id, user, request_id, stream=False):
+            for message in replies:
+                main.reply_registry.resolve(request_id, message)
+
+        monkeypatch.setattr(main, "_publish_chat_request", publish)
+
+        async def consume():
+            response = await main.chat_stream(main.ChatRequest(prompt="hi", session_id=SESSION_ID))
+            body = "".join([part async for part in response.body_iterator])
+            if after is not None:
+                await after()
+            return parse(body)
+
+        return asyncio.run(consume())
+
+    run.saved = saved
+    return run
+
+
+def tokens(events):
+    return "".join(data["delta"] for event, data in events if event == "token")
+
+
+def test_chunks_are_relayed_in_seq_order(stream):
+    events = stream([chunk(1, "lo "), chunk(0, "Hel"), chunk(2, "world"), final("Hello world", 3)])
+    assert [event for event, _ in events] == ["meta", "token", "token", "token", "done"]
+    assert tokens(events) == "Hello world"
+    assert stream.saved == ["Hello world"]
+
+
+def test_final_before_late_chunks_relays_the_rest(stream):
+    # Chunks are published on pooled connections, so the final can overtake them
+    events = stream([chunk(0, "Hel"), final("Hello world", 2), chunk(1, "lo world")])
+    assert tokens(events) == "Hello world"
+    assert events[-1][0] == "done"
+    assert events[-1][1]["reply"] == "Hello world"
+
+
+def test_final_with_a_gap_skips_held_chunks(stream):
+    events = stream([chunk(0, "He"), chunk(2, "world"), final("Hello world", 3)])
+    assert tokens(events) == "Hello world"
+
+
+def test_worker_error_becomes_an_error_event(stream):
+    error = {"request_id": REQUEST_ID, "type": "error", "error": {"type": "upstream_unavailable", "retry_after": 5}}
+    events = stream([chunk(0, "Hel"), error])
+    assert events[-1] == ("error", {"status": 503, "detail": "AI service temporarily unavailable - please try again", "retry_after": 5})
+    assert stream.saved == []
+
+
+@pytest.mark.parametrize("failure", [PoolTimeout("pool exhausted"), main.psycopg.errors.QueryCanceled("timeout")])
+def test_failed_save_emits_error_and_persists_later(stream, monkeypatch, failure):
+    attempts = []
+
+    async def save_reply(*args):
+        raise failure
+
+    async def insert_message(message_id, session_id, prompt, reply, no_answer, user):
+        attempts.append((session_id, prompt, reply))
+
+    monkeypatch.setattr(main, "_save_reply", save_reply)
+    monkeypatch.setattr(main, "insert_message", insert_message)
+
+    async def settle():
+        # Let the late-persist task run
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+    events = stream([chunk(0, "Hello"), final("Hello", 1)], after=settle)
+    assert tokens(events) == "Hello"
+    assert events[-1][0] == "error"
+    assert events[-1][1]["status"] == 503
+    assert attempts == [(SESSION_ID, "hi", "Hello")]
+
+
+def test_deleted_session_is_not_found(monkeypatch):
+    published = []
+
+    async def session_exists(session_id):
+        return False
+
+    async def publish(*args, **kwargs):
+        published.append(args)
+
+    monkeypatch.setattr(main, "_session_exists", session_exists)
+    monkeypatch.setattr(main, "_publish_chat_request", publish)
+
+    with pytest.raises(main.HTTPException) as excinfo:
+        asyncio.run(main.chat_stream(main.ChatRequest(prompt="hi", session_id=SESSION_ID)))
+    assert excinfo.value.status_code == 404
+    assert published == []
+
+
+def test_plain_chat_returns_the_reply_when_saving_fails(monkeypatch):
+    attempts = []
+
+    async def prepare_chat(req):
+        return SESSION_ID, dict(main.DUMMY_USER), REQUEST_ID
+
+    async def publish(req, session_id, user, request_id, stream=False):
+        main.reply_registry.resolve(request_id, final("Hello", 0))
+
+    async def save_reply(*args):
+        raise PoolTimeout("pool exhausted")
+
+    async def insert_message(message_id, session_id, prompt, reply, no_answer, user):
+        attempts.append((message_id, session_id, reply))
+
+    monkeypatch.setattr(main, "_prepare_chat", prepare_chat)
+    monkeypatch.setattr(main, "_publish_chat_request", publish)
+    monkeypatch.setattr(main, "_save_reply", save_reply)
+    monkeypatch.setattr(main, "insert_message", insert_message)
+
+    async def run():
+        response = await main.chat(main.ChatRequest(prompt="hi", session_id=SESSION_ID))
+        await asyncio.gather(*main.background_tasks)
+        return response
+
+    response = asyncio.run(run())
+    assert response.reply == "Hello"
+    assert attempts == [(response.message_id, SESSION_ID, "Hello")]
@@ -0,0 +1,37 @@
+"""Background lifecycle jobs keep running after a failed pass, and stop when cancelled"""
+import asyncio
+
+import pytest
+
+from app.lifecycle import MessageRetention, SessionDeleter
+
+
+async def run_briefly(job, seconds=0.05):
+    job.start()
+    await asyncio.sleep(seconds)
+    assert not job._task.done()
+    job._task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await job._task
+
+
+def test_retention_survives_non_database_errors(monkeypatch):
+    retention = MessageRetention("postgresql://unused", interval_seconds=0.001)
+
+    async def run_once():
+        raise ValueError("bad date math")
+
+    monkeypatch.setattr(retention, "run_once", run_once)
+    asyncio.run(run_briefly(retention))
+    assert retention.failures > 1
+
+
+def test_session_deleter_survives_non_database_errors(monkeypatch):
+    deleter = SessionDeleter("postgresql://unused", poll_seconds=0.001)
+
+    async def purge():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(deleter, "purge", purge)
+    asyncio.run(run_briefly(deleter))
+    assert deleter.failures > 1
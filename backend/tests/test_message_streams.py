@@ -0,0 +1,58 @@
+"""NDJSON message streams: the concurrency cap holds for simultaneous requests"""
+import asyncio
+
+import pytest
+
+from app import main
+
+SESSION_ID = "00000000-0000-0000-0000-0000000000bb"
+
+
+@pytest.fixture
+def streams(monkeypatch):
+    """Two stream slots, and a fake database so no request touches Postgres before its body runs"""
+    monkeypatch.setattr(main, "db", object())
+    monkeypatch.setattr(main, "message_persister", None)
+    monkeypatch.setattr(main, "message_stream_stats", {"active": 0, "rejected": 0})
+
+    async def start(count):
+        monkeypatch.setattr(main, "message_streams", asyncio.Semaphore(2))
+
+        async def request():
+            try:
+                return await main.get_session_messages(SESSION_ID, main.Response(), format="ndjson")
+            except main.HTTPException as e:
+                return e
+
+        return await asyncio.gather(*(request() for _ in range(count)))
+
+    return start
+
+
+def test_concurrent_requests_beyond_the_cap_get_503(streams):
+    async def run():
+        outcomes = await streams(5)
+        accepted = [outcome for outcome in outcomes if isinstance(outcome, main.StreamingResponse)]
+        rejected = [outcome for outcome in outcomes if isinstance(outcome, main.HTTPException)]
+        assert len(accepted) == 2
+        assert [error.status_code for error in rejected] == [503, 503, 503]
+        assert main.message_stream_stats == {"active": 2, "rejected": 3}
+
+        # A response whose body never started still frees its slot, once
+        for response in accepted:
+            await response.background()
+            await response.background()
+        assert main.message_stream_stats["active"] == 0
+        assert not main.message_streams.locked()
+
+    asyncio.run(run())
+
+
+def test_streams_are_oldest_first_only(streams):
+    async def run():
+        with pytest.raises(main.HTTPException) as error:
+            await main.get_session_messages(SESSION_ID, main.Response(), format="ndjson", order="desc")
+        assert error.value.status_code == 400
+        assert main.message_stream_stats["active"] == 0
+
+    asyncio.run(run())
@@ -0,0 +1,161 @@
+"""
+Backend data access: sync ConnectionPool behind asyncio.to_thread vs the async pool
+
+    python bench/db_pool.py --dsn postgresql://postgres@localhost:5432/postgres
+    python bench/db_pool.py --dsn ... --latency-ms 5 --concurrency 10 50 --requests 1000
+
+"thread" is the pre-user-019 data layer: psycopg_pool.ConnectionPool(max_size=5) with
+every query run through asyncio.to_thread (default executor) in its own transaction.
+"async" is app.db.Database (AsyncConnectionPool, autocommit, prepared statements).
+Both run the session list and message page queries of GET /sessions and
+GET /sessions/{id}/messages. --latency-ms puts a local TCP proxy in front of Postgres
+that delays each read by that much, to stand in for a network hop.
+
+The schema is migrated if needed; a benchmark session with 20 messages is created
+and deleted again.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from urllib.parse import urlsplit, urlunsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+# app.main is imported only for its SQL; keep its tracer from reporting to an agent
+os.environ.setdefault("DD_TRACE_ENABLED", "false")
+
+import psycopg  # noqa: E402
+from psycopg_pool import ConnectionPool  # noqa: E402
+
+from app.db import Database  # noqa: E402
+from app.main import MESSAGES_FIRST_PAGE_SQL, SESSIONS_FIRST_PAGE_SQL  # noqa: E402
+from app.migrations import migrate  # noqa: E402
+
+PAGE_SIZE = 50
+
+
+async def start_proxy(dsn: str, latency: float):
+    """Forward a local port to Postgres, sleeping `latency` before relaying each read"""
+    target = urlsplit(dsn)
+
+    async def pipe(reader, writer):
+        try:
+            while data := await reader.read(65536):
+                await asyncio.sleep(latency)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(target.hostname, target.port or 5432)
+        await asyncio.gather(pipe(client_reader, server_writer), pipe(server_reader, client_writer))
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    netloc = f"{target.username or ''}{':' + target.password if target.password else ''}@127.0.0.1:{port}"
+    return server, urlunsplit(target._replace(netloc=netloc))
+
+
+def thread_mode(dsn: str):
+    pool = ConnectionPool(conninfo=dsn, min_size=1, max_size=5, timeout=10, open=True)
+
+    def query_blocking(sql, params):
+        with pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+            conn.commit()
+        return rows
+
+    async def query(endpoint, sql, params):
+        return await asyncio.to_thread(query_blocking, sql, params)
+
+    async def close():
+        await asyncio.to_thread(pool.close)
+    return query, close
+
+
+async def async_mode(dsn: str):
+    db = Database(dsn, min_size=1, max_size=10)
+    await db.open()
+
+    async def query(endpoint, sql, params):
+        async with db.connection(endpoint, transaction=False) as conn:
+            cur = await conn.execute(sql, params)
+            return await cur.fetchall()
+    return query, db.close
+
+
+async def measure(query, endpoint, sql, params, concurrency: int, requests: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await query(endpoint, sql, params)
+            latencies.append(time.perf_counter() - start)
+
+    for _ in range(50):
+        await one()
+    latencies.clear()
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, statistics.median(latencies), latencies[int(0.99 * (len(latencies) - 1))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dsn", default=os.getenv("POSTGRES_DSN"), required=not os.getenv("POSTGRES_DSN"))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    await migrate(args.dsn)
+    session_id = str(uuid.uuid4())
+    async with await psycopg.AsyncConnection.connect(args.dsn, autocommit=True) as conn:
+        await conn.execute("INSERT INTO sessions (id, title) VALUES (%s, 'bench')", (session_id,))
+        for i in range(20):
+            await conn.execute(
+                "INSERT INTO chat_messages (id, session_id, prompt, reply) VALUES (%s, %s, %s, %s)",
+                (uuid.uuid4(), session_id, f"prompt {i}", "r" * 200),
+            )
+
+    proxy, dsn = None, args.dsn
+    if args.latency_ms:
+        proxy, dsn = await start_proxy(args.dsn, args.latency_ms / 1000)
+    print(f"{args.requests} requests per row, +{args.latency_ms}ms per hop, {os.cpu_count()} CPU(s)")
+    print(f"{'endpoint':10} {'conc':>5} {'mode':>7} {'rps':>7} {'p50':>9} {'p99':>9}")
+    try:
+        for mode in ("thread", "async"):
+            query, close = thread_mode(dsn) if mode == "thread" else await async_mode(dsn)
+            try:
+                for concurrency in args.concurrency:
+                    for endpoint, sql, params in (
+                        ("sessions", SESSIONS_FIRST_PAGE_SQL, (PAGE_SIZE,)),
+                        ("messages", MESSAGES_FIRST_PAGE_SQL, (session_id, PAGE_SIZE)),
+                    ):
+                        rps, p50, p99 = await measure(query, endpoint, sql, params, concurrency, args.requests)
+                        print(
+                            f"{endpoint:10} {concurrency:>5} {mode:>7} {rps:>7.0f} "
+                            f"{1000 * p50:>7.1f}ms {1000 * p99:>7.1f}ms"
+                        )
+            finally:
+                await close()
+    finally:
+        if proxy is not None:
+            proxy.close()
+        async with await psycopg.AsyncConnection.connect(args.dsn, autocommit=True) as conn:
+            await conn.execute("DELETE FROM chat_messages WHERE session_id = %s", (session_id,))
+            await conn.execute("DELETE FROM sessions WHERE id = %s", (session_id,))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
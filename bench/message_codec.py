@@ -0,0 +1,88 @@
+"""
+Message size and encode/decode time per wire format
+
+    python bench/message_codec.py
+    python bench/message_codec.py --iterations 500 --turns 0 10 50 200
+
+Payloads are a worker reply (~300 words) and backend requests carrying a
+conversation_history of N turns (40-word prompts, 250-word replies), run through
+encode_message/decode_message as published on the queues.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.messaging import decode_message, encode_message  # noqa: E402
+
+FORMATS = [("json", None), ("msgpack", None), ("json", "gzip"), ("msgpack", "gzip"), ("msgpack", "zstd")]
+
+random.seed(1)
+WORDS = ["".join(random.choices(string.ascii_lowercase, k=random.randint(2, 9))) for _ in range(3000)]
+
+
+def text(words: int) -> str:
+    return " ".join(random.choices(WORDS, k=words))
+
+
+def request(turns: int) -> dict:
+    history = []
+    for _ in range(turns):
+        history.append({"role": "user", "content": text(40)})
+        history.append({"role": "assistant", "content": text(250)})
+    message = {
+        "request_id": "8c665751-4236-4ebe-aa01-08b6e0ad77ba",
+        "session_id": "8c665751-4236-4ebe-aa01-08b6e0ad77bb",
+        "prompt": text(40),
+        "stream": False,
+        "reply_to": "chat_responses.backend-7d9f.1.abcd1234",
+        "priority": "interactive",
+        "enqueued_at": time.time(),
+    }
+    if history:
+        message["conversation_history"] = history
+    return message
+
+
+def reply() -> dict:
+    return {
+        "request_id": "8c665751-4236-4ebe-aa01-08b6e0ad77ba",
+        "session_id": "8c665751-4236-4ebe-aa01-08b6e0ad77bb",
+        "type": "final",
+        "response": text(300),
+        "usage": {"prompt_tokens": 100, "completion_tokens": 400, "total_tokens": 500},
+        "processing_time": 1.2,
+        "timestamp": time.time(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 10, 50])
+    parser.add_argument("--min-bytes", type=int, default=1024, help="compression threshold")
+    args = parser.parse_args()
+
+    cases = [("reply", reply())] + [(f"request, {turns} turns", request(turns)) for turns in args.turns]
+    print(f"{'payload':20} {'format':14} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for name, message in cases:
+        for serializer, compression in FORMATS:
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                encoded = encode_message(message, serializer, compression, args.min_bytes)
+            encode_us = 1e6 * (time.perf_counter() - start) / args.iterations
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                decoded = decode_message(*encoded)
+            decode_us = 1e6 * (time.perf_counter() - start) / args.iterations
+            assert decoded == dict(message, schema_version=decoded["schema_version"])
+            label = serializer + (f"+{compression}" if compression else "")
+            print(f"{name:20} {label:14} {len(encoded[0]):>8} {encode_us:>10.0f} {decode_us:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
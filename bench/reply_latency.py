@@ -0,0 +1,176 @@
+"""
+/chat reply hand-off: 500 ms polling of a shared dict vs the correlation registry
+
+    python bench/reply_latency.py
+    python bench/reply_latency.py --concurrency 1 10 100 1000 --seconds 5
+
+Each reply is delivered after a random 50-500 ms "worker" time, the way each design
+receives it: polling gets it from a consumer thread (the old Kombu consumer), the
+registry from a task on the event loop (the aio-pika consumer that ships). "Added
+latency" is the time from delivery to the waiting handler running again. CPU is the
+event loop thread's CPU time, per request and per second of wall time; it includes the
+registry's on-loop consumer, but not the polling consumer thread.
+"""
+import argparse
+import asyncio
+import heapq
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.replies import ReplyRegistry  # noqa: E402
+
+POLL_INTERVAL = 0.5
+
+
+class PollingStore:
+    """The pre-registry /chat: handlers poll a dict the consumer thread fills"""
+
+    def __init__(self):
+        self.responses = {}
+
+    def deliver(self, request_id, data):
+        self.responses[request_id] = data
+
+    async def wait(self, request_id):
+        while True:
+            data = self.responses.pop(request_id, None)
+            if data is not None:
+                return data
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+class RegistryStore:
+    def __init__(self):
+        self.registry = ReplyRegistry()
+        self.futures = {}
+
+    def register(self, request_id):
+        self.futures[request_id] = self.registry.register(request_id)
+
+    def deliver(self, request_id, data):
+        self.registry.resolve(request_id, data)
+
+    async def wait(self, request_id):
+        return await self.futures.pop(request_id)
+
+
+def consumer(deliveries, store, stop):
+    """Delivers each reply at its due time, like the broker consumer thread"""
+    while not stop.is_set():
+        try:
+            due, request_id = deliveries.get_nowait()
+        except IndexError:
+            time.sleep(0.001)
+            continue
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        store.deliver(request_id, {"request_id": request_id, "delivered_at": time.monotonic()})
+
+
+class DueQueue:
+    """Thread-safe min-heap of (due time, request id)"""
+
+    def __init__(self):
+        self._items = []
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        with self._lock:
+            heapq.heappush(self._items, item)
+
+    def get_nowait(self):
+        with self._lock:
+            if not self._items or self._items[0][0] > time.monotonic() + 0.001:
+                raise IndexError
+            return heapq.heappop(self._items)
+
+
+def loop_consumer(store):
+    """Delivers each reply at its due time from a task on the event loop, like aio-pika"""
+    loop = asyncio.get_running_loop()
+
+    async def on_message(request_id):
+        store.deliver(request_id, {"request_id": request_id, "delivered_at": time.monotonic()})
+
+    def put(item):
+        due, request_id = item
+        # loop.time() is time.monotonic()
+        loop.call_at(due, lambda: loop.create_task(on_message(request_id)))
+
+    return put
+
+
+async def run(mode: str, concurrency: int, seconds: float):
+    stop = threading.Event()
+    if mode == "polling":
+        store = PollingStore()
+        deliveries = DueQueue()
+        thread = threading.Thread(target=consumer, args=(deliveries, store, stop), daemon=True)
+        thread.start()
+        deliver_at = deliveries.put
+    else:
+        store = RegistryStore()
+        thread = None
+        deliver_at = loop_consumer(store)
+    added = []
+    deadline = time.monotonic() + seconds
+    counter = 0
+
+    async def client():
+        nonlocal counter
+        while time.monotonic() < deadline:
+            counter += 1
+            request_id = f"r{counter}"
+            if mode == "registry":
+                store.register(request_id)
+            deliver_at((time.monotonic() + random.uniform(0.05, 0.5), request_id))
+            reply = await store.wait(request_id)
+            added.append(time.monotonic() - reply["delivered_at"])
+
+    cpu = time.thread_time()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    cpu = time.thread_time() - cpu
+    stop.set()
+    if thread is not None:
+        thread.join()
+    added.sort()
+    return {
+        "requests": len(added),
+        "p50_ms": 1000 * statistics.median(added),
+        # Nearest rank, as in the backend's pool wait stats
+        "p99_ms": 1000 * added[max(0, math.ceil(0.99 * len(added)) - 1)],
+        "cpu_us_per_request": 1e6 * cpu / len(added),
+        "cpu_ms_per_second": 1000 * cpu / seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+    random.seed(1)
+    print(
+        f"{'in flight':>9} {'mode':>8} {'requests':>8} {'added p50':>10} {'added p99':>10} "
+        f"{'cpu/request':>12} {'cpu/second':>11}"
+    )
+    for concurrency in args.concurrency:
+        for mode in ("polling", "registry"):
+            result = asyncio.run(run(mode, concurrency, args.seconds))
+            print(
+                f"{concurrency:>9} {mode:>8} {result['requests']:>8} {result['p50_ms']:>8.1f}ms "
+                f"{result['p99_ms']:>8.1f}ms {result['cpu_us_per_request']:>10.0f}us "
+                f"{result['cpu_ms_per_second']:>9.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+export default async function handler(req, res) {
+  const backendUrl = process.env.BACKEND_URL || "http://backend:8000";
+
+  if (req.method === "GET") {
+    // Search messages (one page; pass ?q=&limit=&cursor=&session_id= through and forward the next-page cursor)
+    try {
+      const query = new URLSearchParams(req.query).toString();
+      const response = await fetch(`${backendUrl}/search?${query}`);
+      const data = await response.json();
+      const nextCursor = response.headers.get("x-next-cursor");
+      if (nextCursor) {
+        res.setHeader("X-Next-Cursor", nextCursor);
+      }
+      res.status(response.status).json(data);
+    } catch (error) {
+      console.error("Failed to search messages:", error);
+      res.status(500).json({ error: "Failed to search messages" });
+    }
+  } else {
+    res.status(405).json({ error: "Method not allowed" });
+  }
+}
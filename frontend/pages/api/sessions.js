@@ -2,10 +2,15 @@ export default async function handler(req, res) {
   const backendUrl = process.env.BACKEND_URL || "http://backend:8000";
 
   if (req.method === "GET") {
-    // List sessions
+    // List sessions (one page; pass ?limit=&cursor= through and forward the next-page cursor)
     try {
-      const response = await fetch(`${backendUrl}/sessions`);
+      const query = new URLSearchParams(req.query).toString();
+      const response = await fetch(`${backendUrl}/sessions${query ? `?${query}` : ""}`);
       const data = await response.json();
+      const nextCursor = response.headers.get("x-next-cursor");
+      if (nextCursor) {
+        res.setHeader("X-Next-Cursor", nextCursor);
+      }
       res.status(response.status).json(data);
     } catch (error) {
       console.error("Failed to fetch sessions:", error);
@@ -4,8 +4,15 @@ export default async function handler(req, res) {
 
   if (req.method === "GET") {
     try {
-      const response = await fetch(`${backendUrl}/sessions/${sessionId}/messages`);
+      // One page of messages; pass ?limit=&cursor= through and forward the next-page cursor
+      const { sessionId: _, ...params } = req.query;
+      const query = new URLSearchParams(params).toString();
+      const response = await fetch(`${backendUrl}/sessions/${sessionId}/messages${query ? `?${query}` : ""}`);
       const data = await response.json();
+      const nextCursor = response.headers.get("x-next-cursor");
+      if (nextCursor) {
+        res.setHeader("X-Next-Cursor", nextCursor);
+      }
       res.status(response.status).json(data);
     } catch (error) {
       console.error("Failed to fetch messages:", error);
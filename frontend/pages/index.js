@@ -3,11 +3,15 @@ import ReactMarkdown from "react-markdown";
 import Sidebar from "../components/Sidebar";
 import ChaosPanel from "../components/ChaosPanel";
 
+const MESSAGE_PAGE_SIZE = 50;
+
 export default function Home() {
   // Session management
   const [sessions, setSessions] = useState([]);
   const [currentSessionId, setCurrentSessionId] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingEarlier, setLoadingEarlier] = useState(false);
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const [chaosPanelOpen, setChaosPanelOpen] = useState(false);
   
@@ -18,6 +22,7 @@ export default function Home() {
   
   // Auto-scroll
   const messagesEndRef = useRef(null);
+  const skipAutoScroll = useRef(false);
 
   // Load sessions on mount
   useEffect(() => {
@@ -30,11 +35,16 @@ export default function Home() {
       loadMessages(currentSessionId);
     } else {
       setMessages([]);
+      setOlderCursor(null);
     }
   }, [currentSessionId]);
 
-  // Auto-scroll to bottom when messages change
+  // Auto-scroll to bottom when messages change, but not when earlier ones are prepended
   useEffect(() => {
+    if (skipAutoScroll.current) {
+      skipAutoScroll.current = false;
+      return;
+    }
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
   }, [messages]);
 
@@ -50,21 +60,53 @@ export default function Home() {
     }
   };
 
+  // Fetches one page of a session's history, newest first; returns it oldest first
+  const fetchMessagePage = async (sessionId, cursor) => {
+    const params = new URLSearchParams({ order: "desc", limit: String(MESSAGE_PAGE_SIZE) });
+    if (cursor) params.set("cursor", cursor);
+    const res = await fetch(`/api/sessions/${sessionId}/messages?${params}`);
+    if (!res.ok) return null;
+    const page = await res.json();
+    return { messages: page.reverse(), cursor: res.headers.get("x-next-cursor") };
+  };
+
   const loadMessages = async (sessionId) => {
     try {
-      const res = await fetch(`/api/sessions/${sessionId}/messages`);
-      if (res.ok) {
-        const data = await res.json();
-        setMessages(data);
-      }
+      // Only the latest page; earlier messages load on demand
+      const page = await fetchMessagePage(sessionId, null);
+      if (!page) return;
+      setMessages(page.messages);
+      setOlderCursor(page.cursor);
     } catch (err) {
       console.error("Failed to load messages", err);
     }
   };
 
+  const loadEarlier = async () => {
+    if (!currentSessionId || !olderCursor || loadingEarlier) return;
+    setLoadingEarlier(true);
+    try {
+      const sessionId = currentSessionId;
+      const page = await fetchMessagePage(sessionId, olderCursor);
+      if (!page) return;
+      skipAutoScroll.current = true;
+      setMessages(prevMessages =>
+        prevMessages.length && prevMessages[0].session_id !== sessionId
+          ? prevMessages
+          : [...page.messages, ...prevMessages]
+      );
+      setOlderCursor(page.cursor);
+    } catch (err) {
+      console.error("Failed to load earlier messages", err);
+    } finally {
+      setLoadingEarlier(false);
+    }
+  };
+
   const handleNewChat = () => {
     setCurrentSessionId(null);
     setMessages([]);
+    setOlderCursor(null);
     setPrompt("");
     setError("");
     setSidebarOpen(false);
@@ -93,15 +135,22 @@ export default function Home() {
     }
   };
 
-  const generateTitle = async (sessionId) => {
+  const generateTitle = async (sessionId, attempt = 0) => {
     try {
       const res = await fetch(`/api/sessions/${sessionId}/generate-title`, {
         method: "POST",
       });
       if (res.ok) {
         const data = await res.json();
+        if (data.status === "pending") {
+          // Title is generated by a background job; check back a few times
+          if (attempt < 5) {
+            setTimeout(() => generateTitle(sessionId, attempt + 1), 2000 * (attempt + 1));
+          }
+          return;
+        }
         // Update the session in the list
-        setSessions(sessions.map((s) => 
+        setSessions(prevSessions => prevSessions.map((s) => 
           s.id === sessionId ? { ...s, title: data.title } : s
         ));
       }
@@ -224,6 +273,15 @@ export default function Home() {
             </div>
           ) : (
             <div className="messages">
+              {olderCursor && (
+                <button
+                  className="load-earlier"
+                  onClick={loadEarlier}
+                  disabled={loadingEarlier}
+                >
+                  {loadingEarlier ? "Loading..." : "Load earlier messages"}
+                </button>
+              )}
               {messages.map((msg) => (
                 <div key={msg.id} className="message-pair">
                   <div className="message user-message">
@@ -0,0 +1,131 @@
+"""
+Circuit breaker for the upstream LLM call
+Opens on a high error rate or slow-call rate, fails fast while open and
+probes with a few half-open calls before closing again
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Rolling-window breaker (used from one event loop)"""
+
+    def __init__(
+        self,
+        name: str,
+        window_seconds: float = 60.0,
+        min_calls: int = 5,
+        error_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 30.0,
+        slow_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._half_open_in_flight = 0
+        # (finished_at, ok, slow)
+        self._calls: Deque[Tuple[float, bool, bool]] = deque()
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _trim(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit '{self.name}' {self.state} -> {state}")
+            self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        if state == CLOSED:
+            self._calls.clear()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def _before_call(self) -> None:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(self.retry_after())
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._half_open_in_flight >= self.half_open_max_calls:
+                self.rejected += 1
+                raise CircuitOpenError(1.0)
+            self._half_open_in_flight += 1
+
+    def _after_call(self, ok: bool, duration: float, was_probe: bool) -> None:
+        now = time.monotonic()
+        slow = duration >= self.slow_call_seconds
+        if was_probe:
+            self._half_open_in_flight -= 1
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED if ok and not slow else OPEN)
+            return
+
+        self._calls.append((now, ok, slow))
+        self._trim(now)
+        if self.state != CLOSED or len(self._calls) < self.min_calls:
+            return
+        total = len(self._calls)
+        errors = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+        slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+        if errors / total >= self.error_rate_threshold or slow_calls / total >= self.slow_rate_threshold:
+            self._transition(OPEN)
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._before_call()
+        was_probe = self.state == HALF_OPEN
+        start = time.monotonic()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Not an upstream verdict; just free the probe slot
+            if was_probe:
+                self._half_open_in_flight -= 1
+            raise
+        except Exception:
+            self._after_call(False, time.monotonic() - start, was_probe)
+            raise
+        self._after_call(True, time.monotonic() - start, was_probe)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "state": self.state,
+            "window_calls": len(self._calls),
+            "window_errors": sum(1 for _, ok, _ in self._calls if not ok),
+            "rejected": self.rejected,
+            "times_opened": self.times_opened,
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else 0,
+        }
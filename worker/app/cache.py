@@ -0,0 +1,208 @@
+"""
+Two-tier prompt response cache
+- Exact tier: LRU with TTL keyed by the canonicalized request
+- Semantic tier: in-memory embedding matrix searched with NumPy cosine similarity
+Used from the worker event loop only (not thread-safe)
+"""
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# An embedder maps a batch of texts to an (n, dim) float32 matrix of L2-normalized rows
+Embedder = Callable[[List[str]], np.ndarray]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Local feature-hashing vectorizer (word unigrams + character trigrams)
+
+    A dependency-free stand-in for a real embedding model. It only measures
+    shared vocabulary, so prompts that differ in one meaningful word ("7" vs "9",
+    "python" vs "java") score about as high as true rephrasings; use it with a
+    threshold that only admits near-verbatim repeats.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _TOKEN_RE.findall(text.casefold())
+        features = [f"w:{w}" for w in words]
+        for w in words:
+            padded = f"^{w}$"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                index = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                matrix[row, index] += sign
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class ExactCache:
+    """LRU with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SemanticCache:
+    """Fixed-capacity embedding index; evicts expired, then least recently used, slots"""
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        dim: int,
+        capacity: int = 1000,
+        threshold: float = 0.97,
+        ttl_seconds: float = 3600.0,
+    ):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.capacity = capacity
+        self._matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self._values: List[Any] = [None] * capacity
+        self._expires_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._size = 0
+        self.evictions = 0
+
+    def lookup_many(self, texts: List[str]) -> List[Tuple[Optional[Any], float]]:
+        """Best match per text as (value or None, similarity)"""
+        if not texts:
+            return []
+        if self._size == 0:
+            return [(None, 0.0)] * len(texts)
+
+        now = time.monotonic()
+        queries = self.embedder(texts)
+        # Rows are normalized, so the dot product is the cosine similarity
+        scores = queries @ self._matrix[:self._size].T
+        scores[:, self._expires_at[:self._size] <= now] = -1.0
+
+        results = []
+        for row in range(len(texts)):
+            best = int(np.argmax(scores[row]))
+            similarity = float(scores[row, best])
+            if similarity >= self.threshold:
+                self._last_used[best] = now
+                results.append((self._values[best], similarity))
+            else:
+                results.append((None, similarity))
+        return results
+
+    def lookup(self, text: str) -> Tuple[Optional[Any], float]:
+        return self.lookup_many([text])[0]
+
+    def _free_slot(self, now: float) -> int:
+        if self._size < self.capacity:
+            self._size += 1
+            return self._size - 1
+        expired = np.flatnonzero(self._expires_at <= now)
+        if expired.size:
+            return int(expired[0])
+        self.evictions += 1
+        return int(np.argmin(self._last_used))
+
+    def put(self, text: str, value: Any) -> None:
+        now = time.monotonic()
+        slot = self._free_slot(now)
+        self._matrix[slot] = self.embedder([text])[0]
+        self._values[slot] = value
+        self._expires_at[slot] = now + self.ttl_seconds
+        self._last_used[slot] = now
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class ResponseCache:
+    """Exact tier first, then semantic tier for context-free prompts"""
+
+    def __init__(self, exact: ExactCache, semantic: Optional[SemanticCache] = None):
+        self.exact = exact
+        self.semantic = semantic
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self.lookup_seconds_total = 0.0
+        self.lookup_seconds_max = 0.0
+
+    def get(self, key: str, prompt: str, has_context: bool) -> Tuple[Optional[Any], Optional[str]]:
+        """Return (cached result, tier) or (None, None)"""
+        start = time.perf_counter()
+        try:
+            value = self.exact.get(key)
+            if value is not None:
+                self.hits["exact"] += 1
+                return value, "exact"
+
+            # Answers that depend on earlier turns can't be matched by prompt similarity
+            if self.semantic is not None and not has_context:
+                value, similarity = self.semantic.lookup(prompt)
+                if value is not None:
+                    self.hits["semantic"] += 1
+                    logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+                    return value, "semantic"
+
+            self.misses += 1
+            return None, None
+        finally:
+            elapsed = time.perf_counter() - start
+            self.lookup_seconds_total += elapsed
+            self.lookup_seconds_max = max(self.lookup_seconds_max, elapsed)
+
+    def put(self, key: str, prompt: str, has_context: bool, value: Any) -> None:
+        self.exact.put(key, value)
+        if self.semantic is not None and not has_context:
+            self.semantic.put(prompt, value)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits["exact"] + self.hits["semantic"] + self.misses
+        return {
+            "exact_entries": len(self.exact),
+            "semantic_entries": len(self.semantic) if self.semantic is not None else 0,
+            "semantic_evictions": self.semantic.evictions if self.semantic is not None else 0,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 3) if lookups else 0.0,
+            "lookup_ms_avg": round(1000 * self.lookup_seconds_total / lookups, 3) if lookups else 0.0,
+            "lookup_ms_max": round(1000 * self.lookup_seconds_max, 3),
+        }
@@ -0,0 +1,292 @@
+"""
+Conversation context assembly
+Builds the history for a request from Postgres given only its session_id:
+- Per-session cache loaded incrementally, so each request only reads new messages
+- Recent turns fitted to a token budget with a local tokenizer
+- Older turns folded into a rolling summary (stored in session_summaries) in the background
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import psycopg
+from psycopg_pool import AsyncConnectionPool
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - falls back to a character estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# (created_at, message id) orders a session's messages; used as the load/summary cursor
+Cursor = Tuple[datetime, Any]
+_START: Cursor = (datetime.min.replace(tzinfo=timezone.utc), uuid.UUID(int=0))
+
+# session_summaries is created by the backend's schema migrations. A deleted session has
+# no history (summary or messages), even before the backend purges its rows
+LOAD_SUMMARY_SQL = """
+SELECT ss.summary, ss.through_created_at, ss.through_id
+FROM session_summaries ss JOIN sessions s ON s.id = ss.session_id AND s.deleted_at IS NULL
+WHERE ss.session_id = %s
+"""
+
+# Newest messages after a cursor; the limit bounds the cost for long sessions and big gaps
+LOAD_MESSAGES_SQL = """
+SELECT m.created_at, m.id, m.prompt, m.reply
+FROM chat_messages m JOIN sessions s ON s.id = m.session_id AND s.deleted_at IS NULL
+WHERE m.session_id = %s AND (m.created_at, m.id) > (%s, %s)
+ORDER BY m.created_at DESC, m.id DESC
+LIMIT %s
+"""
+
+# Keep whichever summary covers more of the session if two workers race
+UPSERT_SUMMARY_SQL = """
+INSERT INTO session_summaries (session_id, summary, through_created_at, through_id)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (session_id) DO UPDATE
+SET summary = EXCLUDED.summary,
+    through_created_at = EXCLUDED.through_created_at,
+    through_id = EXCLUDED.through_id,
+    updated_at = NOW()
+WHERE (session_summaries.through_created_at, session_summaries.through_id)
+    < (EXCLUDED.through_created_at, EXCLUDED.through_id)
+"""
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+Keep facts, names, decisions and open questions the assistant may need later. Use at most {max_words} words.
+Only respond with the updated summary.
+
+Current summary:
+{summary}
+
+New exchanges:
+{exchanges}"""
+
+# Per-message token overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+DB_TIMEOUT_SECONDS = 5
+DB_RETRY_SECONDS = 5.0
+
+
+class Tokenizer:
+    """Local token counter: tiktoken when its encoding is available, else ~4 chars per token"""
+
+    def __init__(self, encoding_name: str = "o200k_base"):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"tiktoken encoding '{encoding_name}' unavailable, estimating tokens: {e}")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    cursor: Cursor
+    prompt: str
+    reply: str
+    tokens: int
+
+
+@dataclass
+class SessionContext:
+    summary: str = ""
+    summary_tokens: int = 0
+    summarized_through: Cursor = _START
+    # Unsummarized turns, oldest first
+    turns: List[Turn] = field(default_factory=list)
+    loaded_through: Cursor = _START
+
+
+class ContextBuilder:
+    """Assembles token-budgeted history per session (used from one event loop)
+
+    summarize(prompt) returns the model's text answer.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        summarize: Callable[[str], Awaitable[str]],
+        token_budget: int = 1500,
+        summary_batch_turns: int = 4,
+        summary_max_words: int = 150,
+        max_load_turns: int = 50,
+        cache_sessions: int = 1000,
+        tokenizer: Optional[Tokenizer] = None,
+        pool_size: int = 4,
+    ):
+        self.dsn = dsn
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.summary_batch_turns = summary_batch_turns
+        self.summary_max_words = summary_max_words
+        self.max_load_turns = max_load_turns
+        self.cache_sessions = cache_sessions
+        self.tokenizer = tokenizer or Tokenizer()
+        self._sessions: "OrderedDict[str, SessionContext]" = OrderedDict()
+        self._summarizing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        # Concurrent requests load their sessions in parallel; opened on first use, on the worker loop
+        self._pool = AsyncConnectionPool(
+            dsn,
+            min_size=1,
+            max_size=pool_size,
+            timeout=DB_TIMEOUT_SECONDS,
+            kwargs={"autocommit": True, "connect_timeout": DB_TIMEOUT_SECONDS},
+            open=False,
+        )
+        self._pool_opened = False
+        # After a database failure, skip context until this time instead of stalling every request
+        self._retry_at = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.rows_loaded = 0
+        self.summaries = 0
+        self.failures = 0
+        self.build_seconds_total = 0.0
+        self.builds = 0
+
+    async def _open_pool(self) -> AsyncConnectionPool:
+        if not self._pool_opened:
+            self._pool_opened = True
+            # Does not wait for connections; a database that is down shows up as PoolTimeout
+            await self._pool.open(wait=False)
+        return self._pool
+
+    def _turn(self, created_at: datetime, message_id: Any, prompt: str, reply: str) -> Turn:
+        tokens = self.tokenizer.count(prompt) + self.tokenizer.count(reply) + 2 * MESSAGE_OVERHEAD_TOKENS
+        return Turn((created_at, message_id), prompt, reply, tokens)
+
+    async def _load(self, session_id: str) -> SessionContext:
+        """Cached session context, topped up with any messages saved since the last load"""
+        context = self._sessions.get(session_id)
+        pool = await self._open_pool()
+        async with pool.connection() as conn:
+            if context is None:
+                self.cache_misses += 1
+                context = SessionContext()
+                cur = await conn.execute(LOAD_SUMMARY_SQL, (session_id,))
+                row = await cur.fetchone()
+                if row is not None:
+                    context.summary = row[0]
+                    context.summary_tokens = self.tokenizer.count(row[0]) + MESSAGE_OVERHEAD_TOKENS
+                    context.summarized_through = context.loaded_through = (row[1], row[2])
+            else:
+                self.cache_hits += 1
+            cur = await conn.execute(
+                LOAD_MESSAGES_SQL, (session_id, *context.loaded_through, self.max_load_turns)
+            )
+            rows = await cur.fetchall()
+
+        self.rows_loaded += len(rows)
+        for created_at, message_id, prompt, reply in reversed(rows):
+            # A concurrent load may already have appended these
+            if (created_at, message_id) <= context.loaded_through:
+                continue
+            context.loaded_through = (created_at, message_id)
+            # Turns without a reply would only confuse the model
+            if reply and reply.strip():
+                context.turns.append(self._turn(created_at, message_id, prompt, reply))
+        # Bound memory if summaries keep failing; dropped turns simply go unsummarized
+        del context.turns[:-self.max_load_turns]
+
+        self._sessions[session_id] = context
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.cache_sessions:
+            self._sessions.popitem(last=False)
+        return context
+
+    async def build(self, session_id: str) -> List[Dict[str, str]]:
+        """Chat messages (summary + recent turns) that fit the token budget; [] if unavailable"""
+        start = time.perf_counter()
+        if time.monotonic() < self._retry_at:
+            return []
+        try:
+            context = await self._load(session_id)
+        except psycopg.Error as e:
+            # Answer without history rather than failing the request
+            self.failures += 1
+            self._retry_at = time.monotonic() + DB_RETRY_SECONDS
+            logger.warning(f"Could not load context for session {session_id}: {e}")
+            return []
+
+        budget = self.token_budget - (context.summary_tokens if context.summary else 0)
+        window: List[Turn] = []
+        used = 0
+        for turn in reversed(context.turns):
+            if used + turn.tokens > budget:
+                break
+            window.append(turn)
+            used += turn.tokens
+        window.reverse()
+
+        # Turns that no longer fit are folded into the summary once enough accumulate
+        overflow = context.turns[:len(context.turns) - len(window)]
+        if len(overflow) >= self.summary_batch_turns and session_id not in self._summarizing:
+            self._summarizing.add(session_id)
+            task = asyncio.get_running_loop().create_task(self._summarize(session_id, context, overflow))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        messages: List[Dict[str, str]] = []
+        if context.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {context.summary}"})
+        for turn in window:
+            messages.append({"role": "user", "content": turn.prompt})
+            messages.append({"role": "assistant", "content": turn.reply})
+
+        self.builds += 1
+        self.build_seconds_total += time.perf_counter() - start
+        return messages
+
+    async def _summarize(self, session_id: str, context: SessionContext, turns: List[Turn]) -> None:
+        try:
+            exchanges = "\n".join(f"User: {t.prompt}\nAssistant: {t.reply}" for t in turns)
+            summary = (await self.summarize(SUMMARY_PROMPT.format(
+                max_words=self.summary_max_words,
+                summary=context.summary or "(none yet)",
+                exchanges=exchanges,
+            ))).strip()
+            if not summary:
+                return
+            through = turns[-1].cursor
+            pool = await self._open_pool()
+            async with pool.connection() as conn:
+                await conn.execute(UPSERT_SUMMARY_SQL, (session_id, summary, *through))
+            context.summary = summary
+            context.summary_tokens = self.tokenizer.count(summary) + MESSAGE_OVERHEAD_TOKENS
+            context.summarized_through = through
+            context.turns = [t for t in context.turns if t.cursor > through]
+            self.summaries += 1
+            logger.info(f"Folded {len(turns)} turns into the summary of session {session_id}")
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Failed to update summary for session {session_id}: {e}")
+        finally:
+            self._summarizing.discard(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "cached_sessions": len(self._sessions),
+            "cache_hit_rate": round(self.cache_hits / lookups, 3) if lookups else 0.0,
+            "rows_loaded": self.rows_loaded,
+            "summaries": self.summaries,
+            "summarizing": len(self._summarizing),
+            "failures": self.failures,
+            "build_ms_avg": round(1000 * self.build_seconds_total / self.builds, 3) if self.builds else 0.0,
+        }
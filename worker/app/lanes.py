@@ -0,0 +1,43 @@
+"""
+Per-lane queue wait tracking
+Wait time is measured from the backend's enqueued_at stamp to the moment the
+worker starts a request, so it covers broker queueing plus local buffering
+"""
+import math
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional
+
+
+class LaneStats:
+    """Recent queue-wait samples per priority lane (used from one event loop)"""
+
+    def __init__(self, lane_names: Iterable[str], window: int = 1000):
+        self.window = window
+        self._waits: Dict[str, Deque[float]] = {name: deque(maxlen=window) for name in lane_names}
+        self.started: Dict[str, int] = {name: 0 for name in self._waits}
+
+    def record_start(self, lane_name: str, enqueued_at: Optional[float]) -> Optional[float]:
+        """Count a started request; returns its queue wait in seconds if known"""
+        if lane_name not in self._waits:
+            self._waits[lane_name] = deque(maxlen=self.window)
+            self.started[lane_name] = 0
+        self.started[lane_name] += 1
+        if not enqueued_at:
+            return None
+        # Wall clocks differ slightly between pods; never report a negative wait
+        wait = max(0.0, time.time() - float(enqueued_at))
+        self._waits[lane_name].append(wait)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for name, waits in self._waits.items():
+            ordered = sorted(waits)
+            result[name] = {
+                "started": self.started[name],
+                "wait_ms_avg": round(1000 * sum(ordered) / len(ordered), 1) if ordered else 0.0,
+                "wait_ms_p99": round(1000 * ordered[max(0, math.ceil(0.99 * len(ordered)) - 1)], 1) if ordered else 0.0,
+                "wait_ms_max": round(1000 * ordered[-1], 1) if ordered else 0.0,
+            }
+        return result
@@ -1,43 +1,153 @@
 """
 RabbitMQ messaging using Kombu for DSM support
 """
-import json
 import logging
-import os
+import concurrent.futures
+import queue as queue_module
 import threading
-from typing import Dict, Callable, Optional
-from kombu import Connection, Producer, Consumer, Queue, Exchange
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Callable, Iterable, List, Optional, Tuple
+from kombu import Connection, Consumer, Queue
+from kombu.compression import compress, decompress
+from kombu.pools import ProducerPool
+from kombu.serialization import dumps, loads, prepare_accept_content
+from kombu.utils.encoding import ensure_bytes
 
 logger = logging.getLogger(__name__)
 
+# Every body carries a schema version. Consumers accept JSON and msgpack (optionally
+# compressed, see the "compression" header), so producers can switch format once
+# every consumer runs this code.
+MESSAGE_SCHEMA_VERSION = 2
+ACCEPT_CONTENT = ['json', 'msgpack']
+_ACCEPTED_CONTENT_TYPES = prepare_accept_content(ACCEPT_CONTENT)
+
+
+def encode_message(
+    message: dict,
+    serializer: str = 'json',
+    compression: Optional[str] = None,
+    compression_min_bytes: int = 1024,
+) -> Tuple[bytes, str, str, Dict[str, str]]:
+    """Serialize (and maybe compress) a message; returns (body, content_type, content_encoding, headers)
+
+    The body is compressed only when it reaches compression_min_bytes; headers then
+    carries the compression type in kombu's format so kombu consumers decode it too.
+    """
+    content_type, content_encoding, body = dumps(
+        dict(message, schema_version=MESSAGE_SCHEMA_VERSION), serializer=serializer
+    )
+    body = ensure_bytes(body)
+    headers: Dict[str, str] = {}
+    if compression and len(body) >= compression_min_bytes:
+        body, headers['compression'] = compress(body, compression)
+    return body, content_type, content_encoding, headers
+
+
+def decode_message(body: bytes, content_type: str, content_encoding: str, headers: Optional[dict] = None) -> dict:
+    """Inverse of encode_message; raises on unknown or untrusted content types"""
+    compression_type = (headers or {}).get('compression')
+    if compression_type:
+        body = decompress(body, compression_type)
+    return loads(body, content_type, content_encoding, accept=_ACCEPTED_CONTENT_TYPES)
+
+
+@dataclass
+class Lane:
+    """A priority lane: a request queue plus its scheduling weight and in-flight cap
+
+    Lanes with the same group also share that group's cap in consume_concurrent.
+    """
+    name: str
+    queue_name: str
+    weight: int = 1
+    max_in_flight: Optional[int] = None
+    group: Optional[str] = None
+
+
 class RabbitMQClient:
-    """Kombu-based RabbitMQ client with DSM support"""
+    """Kombu-based RabbitMQ client with DSM support
+
+    Publishing is thread-safe: each publish borrows a producer (with its own
+    pooled connection) from a kombu ProducerPool. Queue entities are built
+    once and kombu caches their declaration per connection, so a queue is
+    declared once per pooled connection rather than on every message.
+    """
     
-    def __init__(self, host: str, port: int, user: str, password: str):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        pool_size: int = 4,
+        serializer: str = 'json',
+        compression: Optional[str] = None,
+        compression_min_bytes: int = 1024,
+    ):
         self.broker_url = f'amqp://{user}:{password}@{host}:{port}//'
+        self.pool_size = pool_size
+        self.serializer = serializer
+        self.compression = compression
+        self.compression_min_bytes = compression_min_bytes
         self.connection: Optional[Connection] = None
-        self.producer: Optional[Producer] = None
+        self.producer_pool: Optional[ProducerPool] = None
+        self._queues: Dict[str, Queue] = {}
+        self._lock = threading.Lock()
         
     def connect(self):
-        """Establish connection and create producer"""
-        self.connection = Connection(self.broker_url)
-        self.connection.connect()
-        self.producer = Producer(self.connection)
-        logger.info(f"Connected to RabbitMQ via Kombu at {self.broker_url}")
+        """Establish the consumer connection and the producer pool"""
+        with self._lock:
+            self.connection = Connection(self.broker_url)
+            self.connection.connect()
+            self.producer_pool = ProducerPool(
+                Connection(self.broker_url).Pool(limit=self.pool_size),
+                limit=self.pool_size,
+            )
+        logger.info(f"Connected to RabbitMQ via Kombu at {self.broker_url} (producer pool size {self.pool_size})")
+    
+    def _queue(self, queue_name: str) -> Queue:
+        """Cached durable Queue entity (stable identity keeps kombu's declare cache warm)"""
+        queue = self._queues.get(queue_name)
+        if queue is None:
+            queue = self._queues.setdefault(queue_name, Queue(queue_name, durable=True))
+        return queue
         
-    def publish(self, queue_name: str, message: dict):
-        """Publish message to queue (DSM auto-instrumented)"""
-        if not self.producer:
-            self.connect()
-            
-        # IMPORTANT: Pass dict directly, let Kombu serialize + inject DSM headers
-        self.producer.publish(
-            message,  # Dict, not json.dumps(message)
-            routing_key=queue_name,
-            declare=[Queue(queue_name, durable=True)],
-            serializer='json',  # Let Kombu handle JSON serialization
-        )
+    def publish(self, queue_name: str, message: dict, declare: bool = True):
+        """Publish message to queue (DSM auto-instrumented)
+
+        Pass declare=False for queues owned by another client (e.g. exclusive reply queues).
+        """
+        self.publish_batch(queue_name, [message], declare=declare)
         logger.info(f"Published message to queue '{queue_name}': {message.get('request_id', 'unknown')}")
+    
+    def publish_batch(self, queue_name: str, messages: Iterable[dict], declare: bool = True) -> int:
+        """Publish several messages while holding a single pooled producer"""
+        if not self.producer_pool:
+            self.connect()
+        
+        declare_entities = [self._queue(queue_name)] if declare else []
+        count = 0
+        with self.producer_pool.acquire(block=True) as producer:
+            for message in messages:
+                # Pre-serialized body with explicit content type; Kombu still injects DSM headers
+                body, content_type, content_encoding, headers = encode_message(
+                    message, self.serializer, self.compression, self.compression_min_bytes
+                )
+                producer.publish(
+                    body,
+                    routing_key=queue_name,
+                    declare=declare_entities,
+                    content_type=content_type,
+                    content_encoding=content_encoding,
+                    headers=headers,
+                    retry=True,
+                    retry_policy={'max_retries': 3, 'interval_start': 0.2, 'interval_step': 0.5},
+                )
+                count += 1
+        return count
         
     def consume(self, queue_name: str, callback: Callable[[dict], None], timeout: float = None):
         """Consume messages from queue (DSM auto-instrumented)"""
@@ -47,20 +157,20 @@ class RabbitMQClient:
         def on_message(body, message):
             """Process message and acknowledge (body is already deserialized by Kombu)"""
             try:
-                # Kombu with accept=['json'] already deserializes JSON -> body is a dict
+                # Kombu decodes (and decompresses) accepted content types -> body is a dict
                 callback(body)
                 message.ack()
             except Exception as e:
                 logger.error(f"Error processing message: {e}", exc_info=True)
                 message.reject()
                 
-        queue = Queue(queue_name, durable=True)
+        queue = self._queue(queue_name)
         
         with Consumer(
             self.connection,
             queues=[queue],
             callbacks=[on_message],
-            accept=['json']
+            accept=ACCEPT_CONTENT
         ):
             logger.info(f"Started consuming from queue '{queue_name}'...")
             
@@ -79,21 +189,158 @@ class RabbitMQClient:
                         logger.error(f"Error in consumer: {e}", exc_info=True)
                         raise
                             
-    def start_consumer_thread(self, queue_name: str, callback: Callable[[dict], None]):
-        """Start background consumer thread"""
-        def consumer_loop():
-            try:
-                self.consume(queue_name, callback)
-            except Exception as e:
-                logger.error(f"Consumer thread crashed: {e}", exc_info=True)
-                
-        thread = threading.Thread(target=consumer_loop, daemon=True)
-        thread.start()
-        logger.info(f"Background consumer thread started for queue '{queue_name}'")
-        return thread
+    def consume_concurrent(
+        self,
+        lanes: List["Lane"],
+        submit: Callable[[dict, str], concurrent.futures.Future],
+        max_in_flight: int,
+        stop_event: Optional[threading.Event] = None,
+        drain_timeout: float = 60.0,
+        group_caps: Optional[Dict[str, int]] = None,
+    ):
+        """Consume one or more priority lanes with up to max_in_flight messages in flight (DSM auto-instrumented)
+
+        Each lane is a queue consumed on its own channel with prefetch equal to
+        the lane's in-flight cap. Delivered messages wait in a per-lane buffer
+        and are dispatched by smooth weighted round-robin, so a busy low-weight
+        lane cannot starve a high-weight one. group_caps bounds the messages in
+        flight across all lanes of a group.
+
+        submit(body, lane_name) starts processing a message body elsewhere
+        (e.g. an asyncio loop) and returns a future. Each message is acked once
+        its future succeeds, or rejected if it fails; acks happen on this thread
+        because Kombu connections are not thread-safe.
+
+        When stop_event is set the consumers are cancelled, buffered messages are
+        requeued, in-flight messages get up to drain_timeout seconds to finish,
+        and the method returns.
+        """
+        if not self.connection:
+            self.connect()
         
+        completed: queue_module.Queue = queue_module.Queue()
+        buffers: Dict[str, Deque] = {lane.name: deque() for lane in lanes}
+        lane_in_flight: Dict[str, int] = {lane.name: 0 for lane in lanes}
+        lane_caps = {lane.name: min(lane.max_in_flight or max_in_flight, max_in_flight) for lane in lanes}
+        current_weight: Dict[str, int] = {lane.name: 0 for lane in lanes}
+        group_caps = group_caps or {}
+        group_in_flight: Dict[str, int] = {group: 0 for group in group_caps}
+        lane_groups = {lane.name: lane.group for lane in lanes if lane.group in group_caps}
+        total_in_flight = 0
+        
+        def make_on_message(lane_name: str):
+            def on_message(body, message):
+                buffers[lane_name].append((body, message))
+            return on_message
+        
+        def pick_lane() -> Optional["Lane"]:
+            eligible = [
+                lane for lane in lanes
+                if buffers[lane.name] and lane_in_flight[lane.name] < lane_caps[lane.name]
+                and (lane.name not in lane_groups
+                     or group_in_flight[lane_groups[lane.name]] < group_caps[lane_groups[lane.name]])
+            ]
+            if not eligible:
+                return None
+            # Smooth weighted round-robin (as in nginx upstream selection)
+            total_weight = sum(lane.weight for lane in eligible)
+            for lane in eligible:
+                current_weight[lane.name] += lane.weight
+            chosen = max(eligible, key=lambda lane: current_weight[lane.name])
+            current_weight[chosen.name] -= total_weight
+            return chosen
+        
+        def dispatch():
+            nonlocal total_in_flight
+            while total_in_flight < max_in_flight:
+                lane = pick_lane()
+                if lane is None:
+                    return
+                body, message = buffers[lane.name].popleft()
+                try:
+                    future = submit(body, lane.name)
+                except Exception as e:
+                    logger.error(f"Error dispatching message: {e}", exc_info=True)
+                    message.reject()
+                    continue
+                total_in_flight += 1
+                lane_in_flight[lane.name] += 1
+                if lane.name in lane_groups:
+                    group_in_flight[lane_groups[lane.name]] += 1
+                future.add_done_callback(lambda f, m=message, n=lane.name: completed.put((n, m, f)))
+        
+        def settle_completed():
+            nonlocal total_in_flight
+            while True:
+                try:
+                    lane_name, message, future = completed.get_nowait()
+                except queue_module.Empty:
+                    return
+                total_in_flight -= 1
+                lane_in_flight[lane_name] -= 1
+                if lane_name in lane_groups:
+                    group_in_flight[lane_groups[lane_name]] -= 1
+                if future.cancelled() or future.exception() is not None:
+                    message.reject()
+                else:
+                    message.ack()
+        
+        consumers = []
+        try:
+            for lane in lanes:
+                consumer = Consumer(
+                    self.connection.channel(),
+                    queues=[self._queue(lane.queue_name)],
+                    callbacks=[make_on_message(lane.name)],
+                    accept=ACCEPT_CONTENT,
+                )
+                consumer.qos(prefetch_count=lane_caps[lane.name])
+                consumer.consume()
+                consumers.append(consumer)
+                logger.info(
+                    f"Started consuming lane '{lane.name}' from queue '{lane.queue_name}' "
+                    f"(weight {lane.weight}, prefetch {lane_caps[lane.name]})..."
+                )
+            
+            drain_deadline = None
+            while True:
+                try:
+                    self.connection.drain_events(timeout=0.05)
+                except TimeoutError:
+                    pass
+                except Exception as e:
+                    logger.error(f"Error in consumer: {e}", exc_info=True)
+                    raise
+                settle_completed()
+                
+                if stop_event is not None and stop_event.is_set():
+                    if drain_deadline is None:
+                        # Stop receiving new deliveries; hand back what hasn't started
+                        for consumer in consumers:
+                            consumer.cancel()
+                        for buffer in buffers.values():
+                            while buffer:
+                                buffer.popleft()[1].requeue()
+                        drain_deadline = time.monotonic() + drain_timeout
+                        logger.info(f"Draining {total_in_flight} in-flight messages...")
+                    if total_in_flight <= 0:
+                        logger.info("Drain complete")
+                        return
+                    if time.monotonic() > drain_deadline:
+                        # Unacked messages are redelivered once the connection closes
+                        logger.warning(f"Drain timed out with {total_in_flight} messages in flight")
+                        return
+                else:
+                    dispatch()
+        finally:
+            for consumer in consumers:
+                consumer.channel.close()
+
     def close(self):
-        """Close connection"""
+        """Close connection and producer pool"""
+        if self.producer_pool:
+            self.producer_pool.force_close_all()
+            self.producer_pool.connections.force_close_all()
         if self.connection:
             self.connection.release()
             logger.info("Closed RabbitMQ connection")
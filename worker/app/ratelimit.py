@@ -0,0 +1,218 @@
+"""
+Cluster-wide LLM rate limiting
+Token buckets for requests/minute and tokens/minute kept in Postgres so every
+worker process and replica draws from the same budget
+"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+REQUESTS_BUCKET = "llm:requests"
+TOKENS_BUCKET = "llm:tokens"
+
+# Postgres must answer within this long (whole seconds, as for connect_timeout); after a
+# failure the limiter fails open without touching the database for DB_RETRY_SECONDS
+DB_TIMEOUT_SECONDS = 5
+DB_RETRY_SECONDS = 5.0
+
+# llm_rate_buckets is created by the backend's schema migrations
+UPSERT_BUCKET_SQL = """
+INSERT INTO llm_rate_buckets (name, capacity, refill_per_second, tokens)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (name) DO UPDATE
+SET capacity = EXCLUDED.capacity, refill_per_second = EXCLUDED.refill_per_second
+"""
+
+# Refill both buckets, then take from both only if both can cover the cost.
+# Rows are locked in name order so concurrent reservations cannot deadlock.
+ACQUIRE_SQL = """
+WITH refilled AS (
+    SELECT name,
+           LEAST(capacity, tokens + refill_per_second * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)) AS available,
+           refill_per_second,
+           CASE WHEN name = %(requests_bucket)s THEN %(request_cost)s ELSE %(token_cost)s END AS cost
+    FROM llm_rate_buckets
+    WHERE name IN (%(requests_bucket)s, %(tokens_bucket)s)
+    ORDER BY name
+    FOR UPDATE
+), decision AS (
+    SELECT bool_and(available >= cost) AS granted FROM refilled
+)
+UPDATE llm_rate_buckets b
+SET tokens = r.available - CASE WHEN d.granted THEN r.cost ELSE 0 END,
+    updated_at = clock_timestamp()
+FROM refilled r, decision d
+WHERE b.name = r.name
+RETURNING d.granted, GREATEST(0, (r.cost - r.available) / NULLIF(r.refill_per_second, 0)) AS wait_seconds
+"""
+
+# Positive adjustment takes more tokens (usage above estimate), negative refunds
+SETTLE_SQL = """
+UPDATE llm_rate_buckets
+SET tokens = LEAST(capacity, tokens - %s)
+WHERE name = %s
+"""
+
+
+class RateLimitExceeded(Exception):
+    """The shared budget could not cover the call within the allowed wait"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM rate limit budget exhausted, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class Reservation:
+    estimated_tokens: int
+    waited_seconds: float
+
+
+def estimate_tokens(messages: list, completion_tokens: int) -> int:
+    """Rough token estimate (~4 chars per token) plus the expected completion size"""
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + 4 * len(messages) + completion_tokens
+
+
+class PostgresRateLimiter:
+    """Shared RPM/TPM token buckets; fails open if Postgres is unreachable or slow"""
+
+    def __init__(
+        self,
+        dsn: str,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_wait_seconds: float = 30.0,
+    ):
+        self.dsn = dsn
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_wait_seconds = max_wait_seconds
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        self._connect_lock = asyncio.Lock()
+        self._retry_at = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.fail_open = 0
+        self.wait_seconds_total = 0.0
+
+    async def _connection(self) -> psycopg.AsyncConnection:
+        async with self._connect_lock:
+            if self._conn is None or self._conn.closed:
+                # Callers queued behind a failed attempt must not each wait out another one
+                if time.monotonic() < self._retry_at:
+                    raise psycopg.OperationalError("rate limiter database unavailable")
+                try:
+                    conn = await psycopg.AsyncConnection.connect(
+                        self.dsn, autocommit=True, connect_timeout=DB_TIMEOUT_SECONDS
+                    )
+                except psycopg.Error:
+                    self._retry_at = time.monotonic() + DB_RETRY_SECONDS
+                    raise
+                try:
+                    await self._setup(conn)
+                except psycopg.Error:
+                    self._retry_at = time.monotonic() + DB_RETRY_SECONDS
+                    await conn.close()
+                    raise
+                self._conn = conn
+        return self._conn
+
+    async def _setup(self, conn: psycopg.AsyncConnection) -> None:
+        # Buckets start full; capacity equals one minute of budget
+        for name, per_minute in (
+            (REQUESTS_BUCKET, self.requests_per_minute),
+            (TOKENS_BUCKET, self.tokens_per_minute),
+        ):
+            await conn.execute(UPSERT_BUCKET_SQL, (name, per_minute, per_minute / 60.0, per_minute))
+        logger.info(
+            f"LLM rate limiter ready: {self.requests_per_minute:.0f} req/min, {self.tokens_per_minute:.0f} tokens/min"
+        )
+
+    async def _try_acquire(self, conn: psycopg.AsyncConnection, tokens: int) -> tuple:
+        cur = await conn.execute(ACQUIRE_SQL, {
+            "requests_bucket": REQUESTS_BUCKET,
+            "tokens_bucket": TOKENS_BUCKET,
+            "request_cost": 1.0,
+            "token_cost": float(tokens),
+        })
+        rows = await cur.fetchall()
+        if not rows:
+            return True, 0.0
+        granted = rows[0][0]
+        wait = max((row[1] or 0.0) for row in rows)
+        return granted, wait
+
+    async def reserve(self, estimated_tokens: int) -> Reservation:
+        """Block until both buckets cover the call, or raise RateLimitExceeded"""
+        # A single call larger than the whole bucket could never be granted
+        estimated_tokens = int(min(estimated_tokens, self.tokens_per_minute))
+        start = time.monotonic()
+        if start < self._retry_at:
+            self.fail_open += 1
+            return Reservation(0, 0.0)
+        throttled = False
+        while True:
+            try:
+                conn = await self._connection()
+                # An open connection to a server that stopped answering would hang forever
+                granted, wait = await asyncio.wait_for(self._try_acquire(conn, estimated_tokens), DB_TIMEOUT_SECONDS)
+            except (psycopg.Error, asyncio.TimeoutError) as e:
+                self.fail_open += 1
+                await self._unavailable(f"Rate limiter unavailable, allowing calls for {DB_RETRY_SECONDS:.0f}s: {e!r}")
+                return Reservation(0, time.monotonic() - start)
+
+            waited = time.monotonic() - start
+            if granted:
+                self.granted += 1
+                self.wait_seconds_total += waited
+                return Reservation(estimated_tokens, waited)
+
+            if not throttled:
+                throttled = True
+                self.throttled += 1
+            if waited + wait > self.max_wait_seconds:
+                self.rejected += 1
+                raise RateLimitExceeded(wait)
+            # Jitter keeps replicas from retrying in lockstep
+            await asyncio.sleep(min(wait, 1.0) + random.uniform(0, 0.05))
+
+    async def settle(self, reservation: Reservation, actual_tokens: int) -> None:
+        """Correct the token bucket with the real usage (0 refunds a failed call)"""
+        if not reservation.estimated_tokens:
+            return
+        adjustment = actual_tokens - reservation.estimated_tokens
+        if adjustment == 0:
+            return
+        if time.monotonic() < self._retry_at:
+            return
+        try:
+            conn = await self._connection()
+            await asyncio.wait_for(conn.execute(SETTLE_SQL, (float(adjustment), TOKENS_BUCKET)), DB_TIMEOUT_SECONDS)
+        except (psycopg.Error, asyncio.TimeoutError) as e:
+            await self._unavailable(f"Failed to settle token usage: {e!r}")
+
+    async def _unavailable(self, message: str) -> None:
+        self._retry_at = time.monotonic() + DB_RETRY_SECONDS
+        logger.warning(message)
+        if self._conn is not None:
+            await self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "rejected": self.rejected,
+            "fail_open": self.fail_open,
+            "wait_seconds_avg": round(self.wait_seconds_total / self.granted, 3) if self.granted else 0.0,
+        }
@@ -0,0 +1,71 @@
+"""
+Single-flight coalescing of identical in-flight LLM requests
+Concurrent requests with the same key share one upstream call
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold and collapse whitespace so trivially different prompts match"""
+    return " ".join((prompt or "").casefold().split())
+
+
+def request_key(model: str, prompt: str, conversation_history: list = None) -> str:
+    """Key by model, normalized prompt and a digest of the conversation history"""
+    history_digest = hashlib.sha256(
+        json.dumps(conversation_history or [], sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+    raw = f"{model}\x00{normalize_prompt(prompt)}\x00{history_digest}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls per key (must be used from one event loop)"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn once per key among concurrent callers; returns (result, shared)"""
+        existing = self._calls.get(key)
+        if existing is not None:
+            self.coalesced += 1
+            # shield: a cancelled follower must not cancel the leader's call
+            return await asyncio.shield(existing), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.upstream_calls += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a failure without followers doesn't log "never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.upstream_calls + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.upstream_calls,
+            "coalesced_requests": self.coalesced,
+            "upstream_calls_saved": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,140 @@
+"""
+Prefork supervisor for the chat worker
+Runs several `app.main` consumer processes so JSON decoding, logging and
+tracing overhead is spread across cores instead of sharing one GIL
+"""
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("app.supervisor")
+
+# Number of consumer processes (defaults to the CPUs available to this process)
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', '0')) or len(os.sched_getaffinity(0))
+# Total in-flight requests for the pod, split across processes; falls back to per-process WORKER_CONCURRENCY
+WORKER_TOTAL_CONCURRENCY = int(os.getenv('WORKER_TOTAL_CONCURRENCY', '0'))
+WORKER_DRAIN_TIMEOUT = float(os.getenv('WORKER_DRAIN_TIMEOUT', '60'))
+RESTART_BACKOFF_INITIAL = float(os.getenv('WORKER_RESTART_BACKOFF_INITIAL', '1'))
+RESTART_BACKOFF_MAX = float(os.getenv('WORKER_RESTART_BACKOFF_MAX', '60'))
+# A child that stayed up this long is considered healthy; its backoff resets
+RESTART_BACKOFF_RESET_AFTER = 60.0
+
+
+class Child:
+    """Bookkeeping for one consumer process slot"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at = 0.0
+        self.backoff = RESTART_BACKOFF_INITIAL
+        self.restart_at = 0.0
+        self.restarts = 0
+
+
+class Supervisor:
+    """Starts N consumer processes, restarts crashed ones with backoff, drains on SIGTERM"""
+
+    def __init__(self, processes: int, total_concurrency: int = 0):
+        self.children: List[Child] = [Child(i) for i in range(processes)]
+        self.total_concurrency = total_concurrency
+        self.stopping = False
+
+    def child_env(self, child: Child) -> Dict[str, str]:
+        env = dict(os.environ)
+        env['WORKER_PROCESS_INDEX'] = str(child.index)
+        if self.total_concurrency:
+            # Spread the pod's prefetch budget; earlier children absorb the remainder
+            base = self.total_concurrency // len(self.children)
+            extra = 1 if child.index < self.total_concurrency % len(self.children) else 0
+            env['WORKER_CONCURRENCY'] = str(max(1, base + extra))
+        return env
+
+    def spawn(self, child: Child) -> None:
+        # Children inherit ddtrace-run's sitecustomize through the environment
+        child.process = subprocess.Popen([sys.executable, '-m', 'app.main'], env=self.child_env(child))
+        child.started_at = time.monotonic()
+        logger.info(f"Started worker process {child.index} (pid {child.process.pid})")
+
+    def reap(self, child: Child) -> None:
+        """Handle an exited child: schedule a restart with exponential backoff"""
+        code = child.process.returncode
+        uptime = time.monotonic() - child.started_at
+        child.process = None
+        if self.stopping:
+            return
+
+        if uptime >= RESTART_BACKOFF_RESET_AFTER:
+            child.backoff = RESTART_BACKOFF_INITIAL
+        delay = child.backoff
+        child.backoff = min(child.backoff * 2, RESTART_BACKOFF_MAX)
+        child.restart_at = time.monotonic() + delay
+        child.restarts += 1
+        logger.warning(
+            f"Worker process {child.index} exited with code {code} after {uptime:.1f}s; "
+            f"restarting in {delay:.1f}s (restart #{child.restarts})"
+        )
+
+    def request_stop(self, signum, frame) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info(f"Received signal {signum}, draining worker processes...")
+        for child in self.children:
+            if child.process and child.process.poll() is None:
+                child.process.send_signal(signal.SIGTERM)
+
+    def drain(self) -> None:
+        """Wait for children to finish in-flight work, then kill stragglers"""
+        deadline = time.monotonic() + WORKER_DRAIN_TIMEOUT + 5
+        for child in self.children:
+            if not child.process:
+                continue
+            try:
+                child.process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logger.warning(f"Worker process {child.index} did not drain in time, killing")
+                child.process.kill()
+                child.process.wait()
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        logger.info(
+            f"Supervisor starting {len(self.children)} worker processes"
+            + (f" sharing concurrency {self.total_concurrency}" if self.total_concurrency else "")
+        )
+        for child in self.children:
+            self.spawn(child)
+
+        while not self.stopping:
+            now = time.monotonic()
+            for child in self.children:
+                if child.process is not None:
+                    if child.process.poll() is not None:
+                        self.reap(child)
+                elif now >= child.restart_at and not self.stopping:
+                    self.spawn(child)
+            time.sleep(0.5)
+
+        self.drain()
+        logger.info("Supervisor stopped")
+        return 0
+
+
+def main():
+    supervisor = Supervisor(WORKER_PROCESSES, WORKER_TOTAL_CONCURRENCY)
+    sys.exit(supervisor.run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Batched session title generation
+Title jobs from the backend are collected for a short window, the sessions that
+still lack a title are loaded in one query, and their titles are generated with
+a single LLM call; sessions that already have a title are skipped
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+# Each message is truncated so a batch prompt stays small
+MESSAGE_CONTEXT_CHARS = 500
+MAX_TITLE_CHARS = 100
+
+# First two messages of every requested session that has no title yet and is not deleted
+FETCH_SQL = """
+SELECT s.id, m.prompt, m.reply
+FROM sessions s
+CROSS JOIN LATERAL (
+    SELECT prompt, reply, created_at FROM chat_messages
+    WHERE session_id = s.id
+    ORDER BY created_at ASC
+    LIMIT 2
+) m
+WHERE s.id = ANY(%s::uuid[]) AND s.title IS NULL AND s.deleted_at IS NULL
+ORDER BY s.id, m.created_at
+"""
+
+# Never overwrite a title set meanwhile (by another worker or a user)
+UPDATE_SQL = """
+UPDATE sessions s
+SET title = v.title
+FROM unnest(%s::uuid[], %s::text[]) AS v(id, title)
+WHERE s.id = v.id AND s.title IS NULL
+"""
+
+SINGLE_PROMPT = """Generate a short 4-5 word title for this conversation. Only respond with the title, nothing else.
+
+Conversation:
+{conversation}"""
+
+BATCH_PROMPT = """Generate a short 4-5 word title for each of the following {count} conversations. Respond with only a JSON array of {count} strings, one title per conversation, in the same order.
+
+{conversations}"""
+
+
+def _format_conversation(messages: List[Tuple[str, str]]) -> str:
+    return "\n".join(
+        f"User: {(prompt or '')[:MESSAGE_CONTEXT_CHARS]}\nAssistant: {(reply or '')[:MESSAGE_CONTEXT_CHARS]}"
+        for prompt, reply in messages
+    )
+
+
+def _clean_title(title: Any) -> str:
+    return str(title).strip().strip('"').strip("'").strip()[:MAX_TITLE_CHARS]
+
+
+def _parse_titles(text: str, count: int) -> Optional[List[str]]:
+    """Titles from a JSON array answer, or None if it doesn't have exactly count entries"""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return None
+    try:
+        titles = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    if not isinstance(titles, list) or len(titles) != count:
+        return None
+    titles = [_clean_title(t) for t in titles]
+    return titles if all(titles) else None
+
+
+class TitleBatcher:
+    """Collects title jobs and processes them in batches (used from one event loop)
+
+    generate(prompt) returns the model's text answer.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        generate: Callable[[str], Awaitable[str]],
+        batch_size: int = 8,
+        max_wait_seconds: float = 0.5,
+    ):
+        self.dsn = dsn
+        self.generate = generate
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Strong references so running batches aren't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+        self._conn: Optional[psycopg.AsyncConnection] = None
+        self._db_lock = asyncio.Lock()
+        self.jobs = 0
+        self.batches = 0
+        self.titled = 0
+        self.skipped = 0
+        self.fallbacks = 0
+        self.failed_batches = 0
+
+    async def submit(self, job: dict) -> None:
+        """Queue a title job and wait until its batch has been processed"""
+        session_id = job.get("session_id")
+        if not session_id:
+            logger.warning("Title job without session_id, skipping")
+            return
+        self.jobs += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((session_id, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_seconds, self._flush)
+        await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        self.batches += 1
+        try:
+            await self._process(list(dict.fromkeys(session_id for session_id, _ in batch)))
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"Title batch of {len(batch)} failed: {e}", exc_info=True)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def _connection(self) -> psycopg.AsyncConnection:
+        if self._conn is None or self._conn.closed or self._conn.broken:
+            self._conn = await psycopg.AsyncConnection.connect(self.dsn, autocommit=True)
+        return self._conn
+
+    async def _fetch(self, session_ids: List[str]) -> Dict[uuid.UUID, List[Tuple[str, str]]]:
+        async with self._db_lock:
+            conn = await self._connection()
+            cur = await conn.execute(FETCH_SQL, (session_ids,))
+            rows = await cur.fetchall()
+        conversations: Dict[uuid.UUID, List[Tuple[str, str]]] = {}
+        for session_id, prompt, reply in rows:
+            conversations.setdefault(session_id, []).append((prompt, reply))
+        return conversations
+
+    async def _store(self, titles: Dict[uuid.UUID, str]) -> None:
+        async with self._db_lock:
+            conn = await self._connection()
+            cur = await conn.execute(UPDATE_SQL, (list(titles), list(titles.values())))
+            self.titled += cur.rowcount
+
+    async def _generate_one(self, messages: List[Tuple[str, str]]) -> str:
+        return _clean_title(await self.generate(SINGLE_PROMPT.format(conversation=_format_conversation(messages))))
+
+    async def _process(self, session_ids: List[str]) -> None:
+        start = time.monotonic()
+        conversations = await self._fetch(session_ids)
+        self.skipped += len(session_ids) - len(conversations)
+        if not conversations:
+            return
+
+        ids = list(conversations)
+        titles: Optional[List[str]] = None
+        if len(ids) == 1:
+            titles = [await self._generate_one(conversations[ids[0]])]
+        else:
+            answer = await self.generate(BATCH_PROMPT.format(
+                count=len(ids),
+                conversations="\n\n".join(
+                    f"Conversation {i}:\n{_format_conversation(conversations[session_id])}"
+                    for i, session_id in enumerate(ids, 1)
+                ),
+            ))
+            titles = _parse_titles(answer, len(ids))
+            if titles is None:
+                # Model ignored the format; title each conversation on its own
+                self.fallbacks += 1
+                logger.warning(f"Unparseable batch title answer for {len(ids)} sessions, falling back")
+                titles = await asyncio.gather(*(self._generate_one(conversations[i]) for i in ids))
+
+        await self._store({session_id: title for session_id, title in zip(ids, titles) if title})
+        logger.info(f"Generated titles for {len(ids)} sessions in {time.monotonic() - start:.2f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "jobs": self.jobs,
+            "batches": self.batches,
+            "avg_batch_size": round(self.jobs / self.batches, 2) if self.batches else 0.0,
+            "titled": self.titled,
+            "skipped": self.skipped,
+            "fallbacks": self.fallbacks,
+            "failed_batches": self.failed_batches,
+        }
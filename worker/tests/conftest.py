@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the service as `app`, the way the supervisor runs it from worker/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,53 @@
+"""consume_concurrent: lanes in a group share one in-flight cap"""
+import concurrent.futures
+import threading
+import time
+
+from app.messaging import Lane, RabbitMQClient
+
+
+def test_grouped_lanes_share_their_cap():
+    client = RabbitMQClient("localhost", 5672, "guest", "guest")
+    client.broker_url = "memory://"
+    client.connect()
+    lanes = [
+        Lane("interactive", "test_interactive", weight=10),
+        Lane("background", "test_background", max_in_flight=2, group="background"),
+        Lane("titles", "test_titles", max_in_flight=2, group="background"),
+    ]
+    for lane in lanes[1:]:
+        client.publish_batch(lane.queue_name, [{"n": n} for n in range(6)])
+    client.publish_batch("test_interactive", [{"n": n} for n in range(4)])
+
+    lock = threading.Lock()
+    in_flight = {"interactive": 0, "background": 0}
+    peak = {"interactive": 0, "background": 0}
+    done = []
+    executor = concurrent.futures.ThreadPoolExecutor(8)
+    stop = threading.Event()
+
+    def work(lane_name):
+        kind = "interactive" if lane_name == "interactive" else "background"
+        with lock:
+            in_flight[kind] += 1
+            peak[kind] = max(peak[kind], in_flight[kind])
+        time.sleep(0.05)
+        with lock:
+            in_flight[kind] -= 1
+            done.append(lane_name)
+            if len(done) == 16:
+                stop.set()
+
+    consumer = threading.Thread(target=lambda: client.consume_concurrent(
+        lanes, lambda body, lane_name: executor.submit(work, lane_name),
+        max_in_flight=4, stop_event=stop, drain_timeout=5, group_caps={"background": 2},
+    ))
+    consumer.start()
+    consumer.join(10)
+    client.close()
+
+    assert not consumer.is_alive()
+    assert len(done) == 16
+    # Background and titles together never exceed the group's 2 slots, leaving 2 for interactive
+    assert peak["background"] == 2
+    assert peak["interactive"] >= 2
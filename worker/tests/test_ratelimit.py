@@ -0,0 +1,129 @@
+"""Shared LLM budget: several worker processes against one Postgres, and failing open"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+
+import psycopg
+import pytest
+
+from app import ratelimit
+from app.ratelimit import PostgresRateLimiter, RateLimitExceeded
+
+# e.g. postgresql://postgres@127.0.0.1:5432/postgres; the test resets llm_rate_buckets there
+POSTGRES_DSN = os.getenv("TEST_POSTGRES_DSN")
+needs_postgres = pytest.mark.skipif(not POSTGRES_DSN, reason="TEST_POSTGRES_DSN not set")
+
+REQUESTS_PER_MINUTE = 30
+PROCESSES = 4
+CALLS_PER_PROCESS = 20
+
+# As created by the backend's migrations (worker_tables)
+BUCKETS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS llm_rate_buckets (
+    name TEXT PRIMARY KEY,
+    capacity DOUBLE PRECISION NOT NULL,
+    refill_per_second DOUBLE PRECISION NOT NULL,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+)
+"""
+
+
+async def fake_llm(tokens: int) -> int:
+    """Stands in for the OpenAI call; returns the tokens it used"""
+    await asyncio.sleep(0.01)
+    return tokens
+
+
+def worker_process(results) -> None:
+    async def run():
+        limiter = PostgresRateLimiter(
+            POSTGRES_DSN, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=1_000_000, max_wait_seconds=0
+        )
+        granted = rejected = 0
+        for _ in range(CALLS_PER_PROCESS):
+            try:
+                reservation = await limiter.reserve(100)
+            except RateLimitExceeded:
+                rejected += 1
+                continue
+            await limiter.settle(reservation, await fake_llm(120))
+            granted += 1
+        results.put((granted, rejected, limiter.fail_open))
+
+    asyncio.run(run())
+
+
+@needs_postgres
+def test_processes_share_one_request_budget():
+    with psycopg.connect(POSTGRES_DSN, autocommit=True) as conn:
+        # The backend's migrations create the table; start from full buckets
+        conn.execute(BUCKETS_TABLE_SQL)
+        conn.execute("DELETE FROM llm_rate_buckets")
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker_process, args=(results,)) for _ in range(PROCESSES)]
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+    outcomes = [results.get(timeout=60) for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.monotonic() - start
+
+    granted = sum(outcome[0] for outcome in outcomes)
+    assert sum(outcome[2] for outcome in outcomes) == 0
+    assert sum(outcome[0] + outcome[1] for outcome in outcomes) == PROCESSES * CALLS_PER_PROCESS
+    # A full bucket (one minute of budget) plus what refilled while the test ran
+    assert REQUESTS_PER_MINUTE <= granted <= REQUESTS_PER_MINUTE + elapsed * REQUESTS_PER_MINUTE / 60 + 1
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_unreachable_database_fails_open_and_backs_off(monkeypatch):
+    attempts = []
+    connect = psycopg.AsyncConnection.connect
+
+    async def counting_connect(*args, **kwargs):
+        attempts.append(kwargs.get("connect_timeout"))
+        return await connect(*args, **kwargs)
+
+    monkeypatch.setattr(psycopg.AsyncConnection, "connect", counting_connect)
+    limiter = PostgresRateLimiter(f"postgresql://postgres@127.0.0.1:{unused_port()}/postgres", 60, 10_000)
+
+    async def run():
+        return [await limiter.reserve(100) for _ in range(3)]
+
+    reservations = asyncio.run(run())
+    assert [r.estimated_tokens for r in reservations] == [0, 0, 0]
+    assert limiter.fail_open == 3
+    # Only the first call tries to connect; the rest fail open inside the retry window
+    assert attempts == [ratelimit.DB_TIMEOUT_SECONDS]
+
+
+def test_unresponsive_database_fails_open_within_the_timeout(monkeypatch):
+    # psycopg enforces a 2 second minimum connect timeout
+    monkeypatch.setattr(ratelimit, "DB_TIMEOUT_SECONDS", 2)
+
+    async def run():
+        # Accepts connections and never answers, like a hung server
+        server = await asyncio.start_server(lambda reader, writer: None, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        limiter = PostgresRateLimiter(f"postgresql://postgres@127.0.0.1:{port}/postgres", 60, 10_000)
+        start = time.monotonic()
+        # Concurrent calls queue on the connect lock; none may wait out its own timeout
+        reservations = await asyncio.gather(*(limiter.reserve(100) for _ in range(5)))
+        elapsed = time.monotonic() - start
+        server.close()
+        return limiter, reservations, elapsed
+
+    limiter, reservations, elapsed = asyncio.run(run())
+    assert all(r.estimated_tokens == 0 for r in reservations)
+    assert limiter.fail_open == 5
+    assert elapsed < 2 * ratelimit.DB_TIMEOUT_SECONDS
@@ -0,0 +1,106 @@
+"""Streamed replies: chunk batching and ordering from a fake OpenAI stream"""
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("DD_TRACE_ENABLED", "false")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("CONTEXT_ENABLED", "false")
+os.environ.setdefault("CACHE_ENABLED", "false")
+
+from app import main  # noqa: E402
+
+REQUEST = {"request_id": "request-1", "session_id": "session-1", "prompt": "hi", "stream": True, "reply_to": "reply-q"}
+
+
+def delta_chunk(text):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(finish_reason=None, delta=SimpleNamespace(content=text))])
+
+
+def usage_chunk(total):
+    return SimpleNamespace(
+        usage=SimpleNamespace(prompt_tokens=1, completion_tokens=total - 1, total_tokens=total), choices=[]
+    )
+
+
+class FakeCompletions:
+    """Yields the scripted deltas, pausing before each one as given"""
+
+    def __init__(self, script):
+        self.script = script
+
+    async def create(self, **params):
+        assert params["stream"] is True
+
+        async def stream():
+            for pause, text in self.script:
+                if pause:
+                    await asyncio.sleep(pause)
+                yield delta_chunk(text)
+            yield usage_chunk(10)
+
+        return stream()
+
+
+@pytest.fixture
+def run(monkeypatch):
+    """Processes one streamed request against a scripted stream; returns the published messages"""
+    published = []
+    monkeypatch.setattr(main, "STREAM_FLUSH_CHARS", 10)
+    monkeypatch.setattr(main, "STREAM_FLUSH_INTERVAL", 0.05)
+    monkeypatch.setattr(main, "llm_breaker", main.CircuitBreaker("openai", min_calls=1))
+
+    async def publish_reply(reply_to, message):
+        published.append(message)
+
+    monkeypatch.setattr(main, "publish_reply", publish_reply)
+
+    def run(script):
+        monkeypatch.setattr(main, "openai_client", SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(script))))
+        asyncio.run(main.process_message(dict(REQUEST)))
+        return published
+
+    return run
+
+
+def chunks(published):
+    return [message for message in published if message["type"] == "chunk"]
+
+
+def test_first_delta_is_flushed_alone_then_batched_by_size(run):
+    published = run([(0, "Hel"), (0, "lo, "), (0, "wor"), (0, "ld and "), (0, "more"), (0, "!")])
+    assert [message["delta"] for message in chunks(published)] == ["Hel", "lo, world and ", "more!"]
+    assert [message["seq"] for message in chunks(published)] == [0, 1, 2]
+    final = published[-1]
+    assert final["type"] == "final"
+    assert final["response"] == "Hello, world and more!"
+    assert final["seq"] == 3
+    assert final["usage"]["total_tokens"] == 10
+
+
+def test_slow_deltas_are_flushed_by_interval(run):
+    published = run([(0, "a"), (0, "b"), (0.08, "c"), (0, "d")])
+    # "c" arrives after the interval, so it goes out with "b" instead of waiting for 10 chars
+    assert [message["delta"] for message in chunks(published)] == ["a", "bc", "d"]
+    assert published[-1]["type"] == "final"
+
+
+def test_publish_failure_is_not_an_upstream_failure(run, monkeypatch):
+    published = []
+
+    async def publish_reply(reply_to, message):
+        if message["type"] == "chunk" and message["seq"] == 1:
+            raise ConnectionError("broker gone")
+        published.append(message)
+
+    monkeypatch.setattr(main, "publish_reply", publish_reply)
+    run([(0, "Hel"), (0, "lo, world and "), (0, "more!")])
+
+    # Chunks stop at the gap; the final carries the whole reply and the breaker saw a success
+    assert [message["delta"] for message in chunks(published)] == ["Hel"]
+    assert published[-1]["type"] == "final"
+    assert published[-1]["response"] == "Hello, world and more!"
+    assert main.llm_breaker.stats()["window_errors"] == 0
+    assert main.llm_breaker.state == "closed"